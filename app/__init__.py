@@ -41,6 +41,12 @@ def create_app(config_class=Config):
     app.register_blueprint(notifications_bp, url_prefix='/notifications')
     app.register_blueprint(usermanagement_bp, url_prefix='/manage')
 
+    # Register CLI commands
+    from .commands import index_audit, upgrade_db, run_jobs
+    app.cli.add_command(index_audit)
+    app.cli.add_command(upgrade_db)
+    app.cli.add_command(run_jobs)
+
     # Create database tables
     with app.app_context():
         db.create_all()
@@ -0,0 +1,49 @@
+import click
+from datetime import date, timedelta
+from ...extensions import db
+from . import bp
+from ...services.attendance_service import AttendanceService
+from ...services.attendance_archive import AttendanceArchive
+
+
+@bp.cli.command('rebuild-summaries')
+def rebuild_summaries():
+    """Recompute all attendance summaries from attendance records."""
+    count = AttendanceService.rebuild_summaries()
+    db.session.commit()
+    click.echo(f'Rebuilt {count} attendance summaries.')
+
+
+@bp.cli.command('check-low-attendance')
+def check_low_attendance():
+    """Send pending low-attendance alerts (suitable for a scheduled job)."""
+    count = AttendanceService.evaluate_low_attendance()
+    db.session.commit()
+    click.echo(f'Sent {count} low attendance alerts.')
+
+
+@bp.cli.command('create-sessions')
+@click.option('--date', 'start', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='First day to create sessions for (default: today).')
+@click.option('--days', default=1, show_default=True, help='Number of days to create.')
+def create_sessions(start, days):
+    """Create attendance sessions from the timetable (run daily)."""
+    start = start.date() if start else date.today()
+    total = 0
+    for offset in range(days):
+        total += AttendanceService.create_scheduled_sessions(start + timedelta(days=offset))
+    db.session.commit()
+    click.echo(f'Created {total} attendance sessions.')
+
+
+@bp.cli.command('archive-term')
+@click.argument('term')
+@click.option('--end-date', required=True, type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Last day of the term; sessions up to this date are archived.')
+def archive_term(term, end_date):
+    """Move a closed term's sessions and records into the archive tables."""
+    if AttendanceArchive.term_exists(term):
+        raise click.ClickException(f'Term "{term}" has already been archived.')
+    sessions, records = AttendanceArchive.archive_term(term, end_date.date())
+    db.session.commit()
+    click.echo(f'Archived {sessions} sessions and {records} records for {term}.')
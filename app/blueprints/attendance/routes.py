@@ -1,14 +1,19 @@
-from flask import render_template, redirect, url_for, flash, request
+from flask import render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
+from datetime import date
 from . import bp
 from .forms import AttendanceSessionForm
-from ...models import (
-    AttendanceSession, AttendanceRecord, AttendanceSummary,
-    Student, Subject, Department
-)
+from ...models import AttendanceSession, Student, Subject, Department
 from ...extensions import db
-from ...utils.decorators import staff_required, student_required
-from ...services.notification_service import NotificationService
+from ...utils.decorators import staff_required, student_required, hod_required
+from ...utils.pagination import keyset_paginate
+from ...services.attendance_service import AttendanceService, StaleSessionError, SESSION_KEYSET
+from ...services.attendance_analytics import AttendanceAnalytics
+from ...services.attendance_archive import AttendanceArchive
+from ...services.reference_data import ReferenceData
+
+
+RECENT_RECORDS = 10  # Records shown per subject on the student attendance page
 
 
 @bp.route('/take', methods=['GET', 'POST'])
@@ -20,10 +25,7 @@ def take():
     staff = current_user.staff
 
     # Populate subject choices with all subjects
-    all_subjects = Subject.query.all()
-    form.subject_id.choices = [
-        (s.id, f'{s.code} - {s.name}') for s in all_subjects
-    ]
+    form.subject_id.choices = ReferenceData.subject_choices()
 
     # Get filter parameters for student list
     filter_year = request.args.get('year', type=int)
@@ -32,11 +34,9 @@ def take():
     # Get students based on filters
     students = []
     if filter_year and filter_section:
-        students = Student.query.filter_by(
-            department_id=staff.department_id,
-            year=filter_year,
-            section=filter_section
-        ).order_by(Student.roll_number).all()
+        students = AttendanceService.class_students_query(
+            staff.department_id, filter_year, filter_section
+        ).all()
         # Pre-fill form with filter values
         form.year.data = filter_year
         form.section.data = filter_section
@@ -73,6 +73,22 @@ def take():
     return render_template('attendance/take.html', form=form, students=students)
 
 
+@bp.route('/today')
+@login_required
+@staff_required
+def today():
+    """List today's sessions created from the timetable."""
+    staff = current_user.staff
+
+    rows = AttendanceService.day_sessions_query(staff.id, date.today()).all()
+
+    timings = {t.period: t for t in ReferenceData.period_timings()}
+
+    return render_template('attendance/today.html',
+                           sessions=[{'session': s, 'marked': marked} for s, marked in rows],
+                           timings=timings)
+
+
 @bp.route('/mark/<int:session_id>', methods=['GET', 'POST'])
 @login_required
 @staff_required
@@ -87,44 +103,26 @@ def mark(session_id):
         return redirect(url_for('attendance.take'))
 
     # Get students for this session
-    students = Student.query.filter_by(
-        department_id=session.department_id,
-        year=session.year,
-        section=session.section
-    ).order_by(Student.roll_number).all()
+    students = AttendanceService.class_students_query(
+        session.department_id, session.year, session.section
+    ).all()
 
     if request.method == 'POST':
         # Get present student IDs from form
         present_ids = request.form.getlist('present')
 
-        for student in students:
-            # Check if record already exists
-            record = AttendanceRecord.query.filter_by(
-                session_id=session.id,
-                student_id=student.id
-            ).first()
-
-            is_present = str(student.id) in present_ids
-
-            if record:
-                record.is_present = is_present
-            else:
-                record = AttendanceRecord(
-                    session_id=session.id,
-                    student_id=student.id,
-                    is_present=is_present
-                )
-                db.session.add(record)
-
-            # Update attendance summary
-            update_attendance_summary(student.id, session.subject_id)
+        AttendanceService.mark_session(session, students, present_ids)
+        AttendanceService.evaluate_low_attendance(
+            subject_id=session.subject_id,
+            student_ids=[s.id for s in students]
+        )
 
         db.session.commit()
         flash('Attendance marked successfully.', 'success')
         return redirect(url_for('attendance.reports'))
 
     # Get existing records
-    existing_records = {r.student_id: r.is_present for r in session.records}
+    existing_records = dict(AttendanceService.session_records_query(session.id).all())
 
     return render_template('attendance/mark.html',
                            session=session,
@@ -132,50 +130,134 @@ def mark(session_id):
                            existing_records=existing_records)
 
 
-def update_attendance_summary(student_id, subject_id):
-    """Update attendance summary for a student-subject pair."""
-    # Get all attendance records for this student-subject
-    records = AttendanceRecord.query.join(AttendanceSession).filter(
-        AttendanceRecord.student_id == student_id,
-        AttendanceSession.subject_id == subject_id
-    ).all()
+@bp.route('/api/sessions/<int:session_id>/marks', methods=['POST'])
+@login_required
+@staff_required
+def api_mark(session_id):
+    """
+    Apply incremental attendance changes for a session.
+    Expects JSON {"version": n, "present": [student ids], "absent": [student ids]}
+    and returns the new version with updated counts.
+    """
+    session = AttendanceSession.query.get_or_404(session_id)
+    staff = current_user.staff
 
-    total_classes = len(records)
-    attended = sum(1 for r in records if r.is_present)
-    percentage = (attended / total_classes * 100) if total_classes > 0 else 0
+    if session.staff_id != staff.id:
+        return jsonify({'error': 'You do not have permission to mark this attendance.'}), 403
+
+    data = request.get_json(silent=True) or {}
+    version = data.get('version')
+    present = data.get('present', [])
+    absent = data.get('absent', [])
+
+    if not isinstance(version, int) or not isinstance(present, list) or not isinstance(absent, list):
+        return jsonify({'error': 'Expected an integer version and present/absent lists.'}), 400
+    try:
+        changes = {int(sid): True for sid in present}
+        absent_ids = {int(sid) for sid in absent}
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Student ids must be integers.'}), 400
+    if absent_ids & changes.keys():
+        return jsonify({'error': 'A student cannot be both present and absent.'}), 400
+    changes.update((sid, False) for sid in absent_ids)
+
+    # Only students of the session's class can be marked
+    valid_count = AttendanceService.class_students_query(
+        session.department_id, session.year, session.section
+    ).filter(Student.id.in_(changes)).count() if changes else 0
+    if valid_count != len(changes):
+        return jsonify({'error': 'Some students do not belong to this session.'}), 400
+
+    try:
+        written = AttendanceService.apply_changes(session, changes, expected_version=version)
+    except StaleSessionError:
+        db.session.rollback()
+        db.session.refresh(session)
+        return jsonify({
+            'error': 'Attendance was changed elsewhere. Reload the page.',
+            'version': session.version
+        }), 409
+
+    AttendanceService.evaluate_low_attendance(
+        subject_id=session.subject_id,
+        student_ids=written
+    )
+    db.session.commit()
+
+    present_count, total = AttendanceService.session_counts(session.id)
+    return jsonify({
+        'version': version + 1,
+        'present': present_count,
+        'absent': total - present_count,
+        'total': total
+    })
 
-    # Get or create summary
-    summary = AttendanceSummary.query.filter_by(
-        student_id=student_id,
-        subject_id=subject_id
-    ).first()
 
-    if not summary:
-        summary = AttendanceSummary(
-            student_id=student_id,
-            subject_id=subject_id
-        )
-        db.session.add(summary)
+@bp.route('/reports')
+@login_required
+@staff_required
+def reports():
+    """View attendance list."""
+    staff = current_user.staff
 
-    summary.total_classes = total_classes
-    summary.attended = attended
-    summary.percentage = percentage
+    subject_id = request.args.get('subject_id', type=int)
+    date_from = request.args.get('date_from', type=date.fromisoformat)
+    date_to = request.args.get('date_to', type=date.fromisoformat)
+    after_date = request.args.get('after_date', type=date.fromisoformat)
+    after_id = request.args.get('after_id', type=int)
+
+    # Present and total counts per session in one grouped query
+    query = AttendanceService.staff_sessions_query(staff.id)
+
+    if subject_id:
+        query = query.filter(AttendanceSession.subject_id == subject_id)
+    if date_from:
+        query = query.filter(AttendanceSession.date >= date_from)
+    if date_to:
+        query = query.filter(AttendanceSession.date <= date_to)
+
+    after = (after_date, after_id) if after_date and after_id else None
+    rows, next_key = keyset_paginate(
+        query,
+        SESSION_KEYSET,
+        key=lambda row: (row[0].date, row[0].id),
+        after=after
+    )
+    sessions = [
+        {'session': session, 'total': total, 'present': present_count or 0}
+        for session, total, present_count in rows
+    ]
 
-    # Check if attendance is below 75% and notify
-    if percentage < 75 and total_classes >= 5:  # Only notify after 5 classes
-        student = Student.query.get(student_id)
-        subject = Subject.query.get(subject_id)
-        NotificationService.notify_low_attendance(student, subject, percentage)
+    subjects = Subject.query.filter(
+        Subject.id.in_(db.session.query(AttendanceSession.subject_id).filter_by(staff_id=staff.id))
+    ).order_by(Subject.name).all()
 
+    next_args = None
+    if next_key:
+        next_args = request.args.to_dict()
+        next_args.update(after_date=next_key[0].isoformat(), after_id=next_key[1])
 
-@bp.route('/reports')
+    return render_template('attendance/reports.html',
+                           sessions=sessions,
+                           subjects=subjects,
+                           next_args=next_args)
+
+
+@bp.route('/archive')
 @login_required
 @staff_required
-def reports():
-    """View attendance list."""
+def archive():
+    """View attendance of archived terms (read-only)."""
     staff = current_user.staff
-    sessions = AttendanceSession.query.filter_by(staff_id=staff.id).order_by(AttendanceSession.date.desc()).all()
-    return render_template('attendance/reports.html', sessions=sessions)
+    terms = AttendanceArchive.staff_terms(staff.id)
+    term = request.args.get('term') or (terms[0] if terms else None)
+
+    sessions = AttendanceArchive.staff_sessions(staff.id, term) if term else []
+
+    return render_template('attendance/archive.html',
+                           terms=terms,
+                           term=term,
+                           sessions=sessions)
 
 
 @bp.route('/my-attendance')
@@ -185,24 +267,40 @@ def my_attendance():
     """View own attendance."""
     student = current_user.student
 
-    # Get attendance summaries
-    summaries = AttendanceSummary.query.filter_by(
-        student_id=student.id
-    ).all()
+    # Get attendance summaries with their subjects
+    summaries = AttendanceService.student_summaries_query(student.id).all()
+
+    # Last few records per subject from a single windowed query
+    recent = AttendanceService.recent_records_query(student.id, RECENT_RECORDS).all()
 
-    # Get detailed records by subject
-    subjects_data = []
-    for summary in summaries:
-        records = AttendanceRecord.query.join(AttendanceSession).filter(
-            AttendanceRecord.student_id == student.id,
-            AttendanceSession.subject_id == summary.subject_id
-        ).order_by(AttendanceSession.date.desc()).all()
+    records_by_subject = {}
+    for record in recent:
+        records_by_subject.setdefault(record.subject_id, []).append(record)
 
-        subjects_data.append({
-            'summary': summary,
-            'records': records[:10]  # Last 10 records
-        })
+    subjects_data = [{
+        'summary': summary,
+        'records': records_by_subject.get(summary.subject_id, [])
+    } for summary in summaries]
 
     return render_template('attendance/my_attendance.html',
                            student=student,
-                           subjects_data=subjects_data)
+                           subjects_data=subjects_data,
+                           past_terms=AttendanceArchive.student_snapshots(student.id))
+
+
+@bp.route('/analytics')
+@login_required
+@hod_required
+def analytics():
+    """Section attendance analytics for the HOD's department."""
+    department_id = current_user.staff.department_id
+    year = request.args.get('year', type=int)
+    section = request.args.get('section', '')
+
+    report = None
+    if year and section:
+        report = AttendanceAnalytics.section_report(department_id, year, section)
+
+    return render_template('attendance/analytics.html',
+                           report=report,
+                           days=['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'])
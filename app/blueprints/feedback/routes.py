@@ -1,10 +1,11 @@
 from flask import render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from . import bp
-from ...models import Feedback, Staff, Subject
+from ...models import Feedback
 from ...extensions import db
 from ...utils.decorators import student_required, staff_required, management_required
 from ...services.notification_service import NotificationService
+from ...services.reference_data import ReferenceData
 from flask_wtf import FlaskForm
 from wtforms import TextAreaField, SelectField, IntegerField, BooleanField, SubmitField
 from wtforms.validators import DataRequired, NumberRange
@@ -32,16 +33,10 @@ def submit():
     student = current_user.student
 
     # Populate staff choices
-    staff_members = Staff.query.all()
-    form.target_staff_id.choices = [(0, 'Select Staff (Optional)')] + [
-        (s.id, s.name) for s in staff_members
-    ]
+    form.target_staff_id.choices = [(0, 'Select Staff (Optional)')] + ReferenceData.staff_choices()
 
     # Populate subject choices - show all subjects
-    subjects = Subject.query.all()
-    form.subject_id.choices = [(0, 'Select Subject (Optional)')] + [
-        (s.id, f'{s.code} - {s.name}') for s in subjects
-    ]
+    form.subject_id.choices = [(0, 'Select Subject (Optional)')] + ReferenceData.subject_choices()
 
     if form.validate_on_submit():
         feedback = Feedback(
@@ -2,4 +2,4 @@ from flask import Blueprint
 
 bp = Blueprint('fees', __name__)
 
-from . import routes
+from . import routes, commands
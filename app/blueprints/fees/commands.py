@@ -0,0 +1,46 @@
+import csv
+import click
+from . import bp
+from ...extensions import db
+from ...services.fee_service import FeeService
+from ...services.fee_reconciliation import (
+    FeeReconciliation, FeeReconciliationError, MAX_REPORTED_UNMATCHED
+)
+
+
+@bp.cli.command('reconcile')
+def reconcile():
+    """Backfill the payment ledger and correct cached paid amounts from it."""
+    posted = FeeService.backfill_ledger()
+    corrected = FeeService.reconcile_balances()
+    db.session.commit()
+    click.echo(f'Posted {posted} opening entries; corrected {corrected} fee balances.')
+
+
+@bp.cli.command('reconcile-statement')
+@click.argument('statement', type=click.File('rb'))
+@click.option('--unmatched-out', type=click.File('w', encoding='utf-8'),
+              help='Write every unmatched line to this CSV file.')
+def reconcile_statement(statement, unmatched_out):
+    """Post payments from a bank statement CSV file."""
+    try:
+        report = FeeReconciliation.reconcile_statement(
+            FeeReconciliation.iter_rows(statement),
+            max_unmatched=None if unmatched_out else MAX_REPORTED_UNMATCHED
+        )
+    except FeeReconciliationError as e:
+        db.session.rollback()
+        raise click.ClickException(str(e))
+    db.session.commit()
+
+    methods = ', '.join(f'{count} by {method}' for method, count in report['methods'].items())
+    click.echo(f"Matched {report['matched']} of {report['lines']} lines "
+               f"({report['amount']:.2f}){': ' + methods if methods else ''}.")
+    if unmatched_out:
+        writer = csv.writer(unmatched_out)
+        writer.writerow(['line', 'transaction_id', 'roll_number', 'amount', 'reason'])
+        writer.writerows(report['unmatched'])
+        click.echo(f"Wrote {report['unmatched_count']} unmatched lines to {unmatched_out.name}.")
+    else:
+        for line in report['unmatched']:
+            click.echo('Line {}: {} {} {} - {}'.format(*line))
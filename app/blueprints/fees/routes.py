@@ -4,12 +4,21 @@ from . import bp
 from ...models import FeeStructure, StudentFees, Student, Department
 from ...extensions import db
 from ...utils.decorators import management_required, student_required
+from ...services.fee_service import (
+    FeeService, FeeLedgerError, AGING_BUCKETS, AMOUNT_EPSILON, FEE_SORTS
+)
+from ...services.fee_reconciliation import FeeReconciliation, FeeReconciliationError
+from ...services.reference_data import ReferenceData
+from ...utils.pagination import keyset_paginate
 from flask_wtf import FlaskForm
 from wtforms import StringField, SelectField, FloatField, DateField, TextAreaField, SubmitField, SelectMultipleField
 from wtforms.validators import DataRequired, NumberRange, Optional
 from datetime import date, datetime
 
 
+PENDING_PER_PAGE = 50
+
+
 class FeeStructureForm(FlaskForm):
     academic_year = StringField('Academic Year', validators=[DataRequired()],
                                  default=f'{date.today().year}-{str(date.today().year + 1)[-2:]}')
@@ -34,7 +43,12 @@ class SingleStudentFeeForm(FlaskForm):
 
 class EditStudentFeeForm(FlaskForm):
     amount_due = FloatField('Amount Due', validators=[DataRequired(), NumberRange(min=0)])
-    amount_paid = FloatField('Amount Paid', validators=[DataRequired(), NumberRange(min=0)])
+    entry_type = SelectField('Entry Type', choices=[
+        ('payment', 'Payment'),
+        ('refund', 'Refund')
+    ], default='payment')
+    entry_amount = FloatField('Amount', validators=[Optional(), NumberRange(min=0.01)])
+    entry_reference = StringField('Transaction ID', validators=[Optional()])
     remarks = TextAreaField('Remarks')
     submit = SubmitField('Update Fee')
 
@@ -98,34 +112,10 @@ def upload():
         fee_structure_id = request.form.get('fee_structure_id', type=int)
         fee_structure = FeeStructure.query.get_or_404(fee_structure_id)
 
-        # Get students matching the fee structure criteria
-        query = Student.query
-        if fee_structure.year:
-            query = query.filter_by(year=fee_structure.year)
-        if fee_structure.department_id:
-            query = query.filter_by(department_id=fee_structure.department_id)
-
-        students = query.all()
-
-        count = 0
-        for student in students:
-            # Check if fee already assigned
-            existing = StudentFees.query.filter_by(
-                student_id=student.id,
-                fee_structure_id=fee_structure.id
-            ).first()
-
-            if not existing:
-                student_fee = StudentFees(
-                    student_id=student.id,
-                    fee_structure_id=fee_structure.id,
-                    amount_due=fee_structure.amount
-                )
-                db.session.add(student_fee)
-                count += 1
-
+        result = FeeService.assign_fee_structure(fee_structure)
         db.session.commit()
-        flash(f'Fees assigned to {count} students.', 'success')
+        flash(f"Fees assigned to {result['assigned']} of {result['eligible']} matching students "
+              f"({result['skipped']} already assigned) in {result['seconds']:.2f}s.", 'success')
         return redirect(url_for('fees.student_fees_list'))
 
     fee_structures = FeeStructure.query.order_by(FeeStructure.created_at.desc()).all()
@@ -206,16 +196,7 @@ def add_multiple():
         db.session.add(fee_structure)
         db.session.flush()
 
-        count = 0
-        for student_id in student_ids:
-            student_fee = StudentFees(
-                student_id=int(student_id),
-                fee_structure_id=fee_structure.id,
-                amount_due=amount
-            )
-            db.session.add(student_fee)
-            count += 1
-
+        count = FeeService.assign_to_students(fee_structure, [int(sid) for sid in student_ids], amount)
         db.session.commit()
         flash(f'Fee added to {count} students successfully.', 'success')
         return redirect(url_for('fees.student_fees_list'))
@@ -235,23 +216,56 @@ def add_multiple():
 @login_required
 @management_required
 def student_fees_list():
-    """View all student fees with filters."""
+    """View student fees with filters, search and sorting, one page at a time."""
     department_id = request.args.get('department_id', type=int)
     status = request.args.get('status')
-
-    query = StudentFees.query.join(Student)
-
-    if department_id:
-        query = query.filter(Student.department_id == department_id)
-    if status:
-        query = query.filter(StudentFees.payment_status == status)
-
-    fees = query.order_by(StudentFees.created_at.desc()).all()
-    departments = Department.query.all()
+    search = request.args.get('q', '').strip()
+    sort = request.args.get('sort')
+    if sort not in FEE_SORTS:
+        sort = 'newest'
+    columns, descending, parse, cursor = FEE_SORTS[sort]
+
+    filters = FeeService.fee_list_filters(department_id, status, search)
+    query = FeeService.student_fees_query(filters)
+
+    after = None
+    after_value = request.args.get('after')
+    after_id = request.args.get('after_id', type=int)
+    if after_value is not None and after_id:
+        try:
+            after = (parse(after_value), after_id)
+        except ValueError:
+            after = None
+
+    fees, next_key = keyset_paginate(
+        query, columns,
+        key=lambda fee: (cursor(fee), fee.id),
+        after=after,
+        descending=descending
+    )
+
+    # Totals over every matching fee, not just this page
+    totals = FeeService.student_fees_totals(filters)
+
+    next_args = None
+    if next_key:
+        next_args = request.args.to_dict()
+        value = next_key[0]
+        next_args.update(sort=sort, after=value.isoformat() if hasattr(value, 'isoformat') else value,
+                         after_id=next_key[1])
+    first_args = None
+    if after:
+        first_args = request.args.to_dict()
+        first_args.pop('after', None)
+        first_args.pop('after_id', None)
 
     return render_template('fees/student_fees_list.html',
-                          fees=fees,
-                          departments=departments)
+                           fees=fees,
+                           totals=totals,
+                           sort=sort,
+                           next_args=next_args,
+                           first_args=first_args,
+                           departments=ReferenceData.departments())
 
 
 @bp.route('/student-fees/edit/<int:id>', methods=['GET', 'POST'])
@@ -262,20 +276,44 @@ def edit_student_fee(id):
     student_fee = StudentFees.query.get_or_404(id)
     form = EditStudentFeeForm(obj=student_fee)
 
-    if form.validate_on_submit():
-        student_fee.amount_due = form.amount_due.data
-        student_fee.amount_paid = form.amount_paid.data
+    paid = student_fee.amount_paid or 0
+    refund_too_large = form.entry_type.data == 'refund' and \
+        (form.entry_amount.data or 0) > paid + AMOUNT_EPSILON
+    submitted = form.validate_on_submit()
+    if submitted and refund_too_large:
+        form.entry_amount.errors.append(f'Refund cannot exceed the amount paid ({paid:.2f}).')
+    elif submitted:
         student_fee.remarks = form.remarks.data
-        student_fee.update_status()
-
-        if student_fee.amount_paid > 0:
-            student_fee.payment_date = datetime.utcnow()
+        if form.amount_due.data != student_fee.amount_due:
+            FeeService.set_amount_due(student_fee.id, form.amount_due.data)
+
+        # Payments are appended to the ledger rather than overwriting amount_paid
+        if form.entry_amount.data:
+            try:
+                FeeService.record_entry(
+                    student_fee.id,
+                    form.entry_amount.data,
+                    form.entry_type.data,
+                    transaction_id=form.entry_reference.data or None,
+                    remarks=form.remarks.data or None,
+                    recorded_by=current_user.id
+                )
+            except FeeLedgerError as e:
+                db.session.rollback()
+                flash(str(e), 'danger')
+                return redirect(url_for('fees.edit_student_fee', id=student_fee.id))
+            except ValueError:
+                # Deleted while the form was being submitted
+                db.session.rollback()
+                flash('This fee no longer exists.', 'danger')
+                return redirect(url_for('fees.student_fees_list'))
 
         db.session.commit()
         flash('Fee updated successfully.', 'success')
         return redirect(url_for('fees.student_fees_list'))
 
-    return render_template('fees/edit_student_fee.html', form=form, student_fee=student_fee)
+    return render_template('fees/edit_student_fee.html', form=form, student_fee=student_fee,
+                           payments=student_fee.payments.all())
 
 
 @bp.route('/student-fees/delete/<int:id>', methods=['POST'])
@@ -286,6 +324,11 @@ def delete_student_fee(id):
     student_fee = StudentFees.query.get_or_404(id)
     student_name = student_fee.student.name
 
+    # The ledger is append-only, so fees with posted entries are kept
+    if student_fee.payments.first():
+        flash(f'Cannot delete. The fee for {student_name} has recorded payments.', 'danger')
+        return redirect(url_for('fees.student_fees_list'))
+
     db.session.delete(student_fee)
     db.session.commit()
 
@@ -299,36 +342,68 @@ def delete_student_fee(id):
 def mark_paid(id):
     """Mark fee as fully paid."""
     student_fee = StudentFees.query.get_or_404(id)
-    student_fee.amount_paid = student_fee.amount_due
-    student_fee.payment_status = 'paid'
-    student_fee.payment_date = datetime.utcnow()
-
+    FeeService.settle(student_fee, recorded_by=current_user.id)
     db.session.commit()
     flash(f'Fee for {student_fee.student.name} marked as paid.', 'success')
     return redirect(url_for('fees.student_fees_list'))
 
 
+@bp.route('/reconcile', methods=['GET', 'POST'])
+@login_required
+@management_required
+def reconcile():
+    """Post payments from a bank statement CSV and report the unmatched lines."""
+    report = None
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if not file or not file.filename:
+            flash('Please choose a statement file to upload.', 'warning')
+            return redirect(url_for('fees.reconcile'))
+        if not file.filename.lower().endswith('.csv'):
+            flash('Upload the bank statement as a .csv file.', 'warning')
+            return redirect(url_for('fees.reconcile'))
+
+        try:
+            report = FeeReconciliation.reconcile_statement(
+                FeeReconciliation.iter_rows(file.stream), recorded_by=current_user.id)
+        except FeeReconciliationError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('fees.reconcile'))
+        db.session.commit()
+
+        if report['unmatched_count']:
+            flash(f"Recorded {report['matched']} payments; "
+                  f"{report['unmatched_count']} lines were not matched.", 'warning')
+        else:
+            flash(f"Recorded {report['matched']} payments.", 'success')
+
+    return render_template('fees/reconcile.html', report=report)
+
+
 @bp.route('/pending-report')
 @login_required
 @management_required
 def pending_report():
     """View pending fees report."""
-    pending_fees = StudentFees.query.filter(
-        StudentFees.payment_status != 'paid'
-    ).order_by(StudentFees.created_at.desc()).all()
-
-    # Group by department
-    by_department = {}
-    for fee in pending_fees:
-        dept_name = fee.student.department.name if fee.student.department else 'Unknown'
-        if dept_name not in by_department:
-            by_department[dept_name] = {'count': 0, 'total': 0, 'fees': []}
-        by_department[dept_name]['count'] += 1
-        by_department[dept_name]['total'] += fee.balance
-        by_department[dept_name]['fees'].append(fee)
+    departments, totals = FeeService.pending_summary()
+
+    department_id = request.args.get('department_id', type=int)
+    bucket = request.args.get('bucket')
+    if bucket not in [key for key, _, _, _ in AGING_BUCKETS]:
+        bucket = None
+    page = request.args.get('page', 1, type=int)
+
+    pending_fees = FeeService.pending_fees_query(department_id, bucket).paginate(
+        page=page, per_page=PENDING_PER_PAGE, error_out=False
+    )
 
     return render_template('fees/pending_report.html',
-                           by_department=by_department,
+                           departments=departments,
+                           totals=totals,
+                           aging_buckets=AGING_BUCKETS,
+                           department_id=department_id,
+                           bucket=bucket,
                            pending_fees=pending_fees)
 
 
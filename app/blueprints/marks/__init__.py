@@ -2,4 +2,4 @@ from flask import Blueprint
 
 bp = Blueprint('marks', __name__)
 
-from . import routes
+from . import routes, commands
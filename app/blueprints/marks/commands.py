@@ -0,0 +1,108 @@
+import click
+from . import bp
+from ...extensions import db
+from ...models import GradingScheme, GradeBand
+from ...services.marks_service import MarksService
+from ...services.rank_service import RankService
+from ...services.marks_analytics import MarksAnalytics
+from ...utils.db import upsert_insert
+
+
+def parse_bands(value):
+    """Parse "90:O,80:A+,...,0:F" into ascending (min percentage, grade) tuples."""
+    bands = []
+    for item in value.split(','):
+        try:
+            minimum, grade = item.split(':')
+            bands.append((float(minimum), grade.strip()))
+        except ValueError:
+            raise click.BadParameter(f'Invalid band "{item}"; expected MIN:GRADE.')
+    bands.sort()
+    if not bands or bands[0][0] != 0:
+        raise click.BadParameter('The lowest band must start at 0.')
+    if any(not grade or len(grade) > 2 for _, grade in bands):
+        raise click.BadParameter('Grades must be 1-2 characters.')
+    return bands
+
+
+@bp.cli.command('set-scheme')
+@click.argument('name')
+@click.option('--bands', required=True, help='Bands as MIN:GRADE pairs, e.g. "90:O,80:A+,40:C,0:F".')
+@click.option('--department-id', type=int, help='Limit the scheme to one department.')
+@click.option('--exam-type', type=click.Choice(['assignment', 'internal', 'final']),
+              help='Limit the scheme to one exam type.')
+@click.option('--regrade', is_flag=True, help='Regrade existing marks afterwards.')
+def set_scheme(name, bands, department_id, exam_type, regrade):
+    """Create or replace the grading scheme for a department/exam type scope."""
+    bands = parse_bands(bands)
+    # One scheme per scope, including the NULL ("any") scopes
+    stmt = upsert_insert(GradingScheme).values(
+        name=name, department_id=department_id, exam_type=exam_type
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=GradingScheme.scope_key(),
+        set_={'name': stmt.excluded.name}
+    )
+    db.session.execute(stmt)
+    scheme = GradingScheme.query.filter(
+        GradingScheme.department_id.is_(None) if department_id is None
+        else GradingScheme.department_id == department_id,
+        GradingScheme.exam_type.is_(None) if exam_type is None
+        else GradingScheme.exam_type == exam_type
+    ).one()
+    # Delete the old bands first, or the new ones collide with them on unique_grade_band
+    scheme.bands.clear()
+    db.session.flush()
+    scheme.bands = [GradeBand(min_percentage=minimum, grade=grade) for minimum, grade in bands]
+    db.session.commit()
+    click.echo(f'Saved grading scheme "{name}" with {len(bands)} bands.')
+
+    if regrade:
+        count = MarksService.regrade(department_id=department_id)
+        db.session.commit()
+        click.echo(f'Regraded {count} marks.')
+
+
+@bp.cli.command('list-schemes')
+def list_schemes():
+    """List grading schemes and their bands."""
+    for scheme in GradingScheme.query.order_by(GradingScheme.id):
+        scope = f'department {scheme.department_id}' if scheme.department_id else 'all departments'
+        scope += f', {scheme.exam_type}' if scheme.exam_type else ', all exam types'
+        bands = ', '.join(f'{band.min_percentage:g}:{band.grade}' for band in reversed(scheme.bands))
+        click.echo(f'{scheme.name} ({scope}): {bands}')
+
+
+@bp.cli.command('regrade')
+@click.option('--department-id', type=int, help='Only regrade exams of this department.')
+@click.option('--semester', type=int, help='Only regrade exams of subjects in this semester.')
+def regrade(department_id, semester):
+    """Recompute stored grades from the current grading schemes."""
+    count = MarksService.regrade(department_id=department_id, semester=semester)
+    db.session.commit()
+    click.echo(f'Regraded {count} marks.')
+
+
+@bp.cli.command('rebuild-results')
+def rebuild_results():
+    """Recompute every student's SGPA/CGPA summaries from the marks."""
+    count = MarksService.rebuild_result_summaries()
+    db.session.commit()
+    click.echo(f'Rebuilt {count} result summaries.')
+
+
+@bp.cli.command('rebuild-ranks')
+def rebuild_ranks():
+    """Recompute exam and SGPA ranks for every department semester."""
+    method = 'window functions' if RankService.window_functions_supported() else 'NumPy'
+    count = RankService.refresh_all()
+    db.session.commit()
+    click.echo(f'Rebuilt {count} ranks using {method}.')
+
+
+@bp.cli.command('refresh-stats')
+def refresh_stats():
+    """Recompute cached exam statistics and anomaly flags for every exam."""
+    count = MarksAnalytics.refresh()
+    db.session.commit()
+    click.echo(f'Refreshed statistics for {count} exams.')
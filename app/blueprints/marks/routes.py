@@ -1,16 +1,34 @@
-from flask import render_template, redirect, url_for, flash, request
+from flask import (
+    render_template, redirect, url_for, flash, request, jsonify, abort,
+    Response, stream_with_context
+)
 from flask_login import login_required, current_user
+from sqlalchemy.orm import contains_eager
 from . import bp
-from ...models import Exam, Marks, Student, Subject
+from ...models import (
+    Exam, Marks, Student, Subject, StudentRank, ExamStatistics,
+    BackgroundJob
+)
 from ...extensions import db
-from ...utils.decorators import staff_required, student_required
-from ...services.notification_service import NotificationService
+from ...utils.decorators import staff_required, student_required, hod_required, role_required
+from ...services.marks_service import MarksService
+from ...services.marks_import import MarksImport, MarksImportError
+from ...services.rank_service import RankService
+from ...services.marks_analytics import MarksAnalytics
+from ...services.job_queue import JobQueue
+from ...services.marks_export import MarksExport
+from ...services.reference_data import ReferenceData
 from flask_wtf import FlaskForm
 from wtforms import StringField, SelectField, IntegerField, DateField, SubmitField
 from wtforms.validators import DataRequired, NumberRange, Length
 from datetime import date
 
 
+EXAMS_PER_PAGE = 5
+RANKS_PER_PAGE = 50
+REVIEW_PER_PAGE = 50
+
+
 class ExamForm(FlaskForm):
     name = StringField('Exam Name', validators=[DataRequired()])
     exam_type = SelectField('Exam Type', choices=[
@@ -34,8 +52,9 @@ class ExamForm(FlaskForm):
 def manage():
     """View and manage exams."""
     staff = current_user.staff
-    exams = Exam.query.filter_by(created_by=staff.id).order_by(Exam.date.desc()).all()
-    return render_template('marks/manage.html', exams=exams)
+    exams = MarksService.staff_exams_query(staff.id).all()
+    publish_jobs = JobQueue.latest_jobs('publish_results', 'exam', [exam.id for exam in exams])
+    return render_template('marks/manage.html', exams=exams, publish_jobs=publish_jobs)
 
 
 @bp.route('/create-exam', methods=['GET', 'POST'])
@@ -90,37 +109,28 @@ def enter(exam_id):
     ).order_by(Student.roll_number).all()
 
     if request.method == 'POST':
+        entries = {}
         for student in students:
             marks_value = request.form.get(f'marks_{student.id}')
 
             if marks_value:
                 try:
-                    marks_obtained = float(marks_value)
+                    entries[student.id] = float(marks_value)
                 except ValueError:
                     continue
 
-                # Get or create marks record
-                mark = Marks.query.filter_by(
-                    exam_id=exam.id,
-                    student_id=student.id
-                ).first()
-
-                if not mark:
-                    mark = Marks(exam_id=exam.id, student_id=student.id)
-                    db.session.add(mark)
-
-                mark.marks_obtained = marks_obtained
-                mark.calculate_grade(exam.max_marks)
-
-                # Notify student
-                NotificationService.notify_result_uploaded(student, exam)
-
+        updated_ids = set(MarksService.save_exam_marks(exam, entries))
+        MarksService.refresh_result_summaries(updated_ids)
+        if updated_ids:
+            RankService.refresh_for_exam(exam)
+            MarksAnalytics.refresh([exam.subject_id])
         db.session.commit()
-        flash('Marks entered successfully.', 'success')
+
+        flash('Marks entered successfully. Publish the results to notify students.', 'success')
         return redirect(url_for('marks.manage'))
 
     # Get existing marks
-    existing_marks = {m.student_id: m for m in exam.marks}
+    existing_marks = {m.student_id: m for m in MarksService.exam_marks_query(exam.id)}
 
     return render_template('marks/enter.html',
                            exam=exam,
@@ -128,6 +138,87 @@ def enter(exam_id):
                            existing_marks=existing_marks)
 
 
+@bp.route('/import/<int:exam_id>', methods=['GET', 'POST'])
+@login_required
+@staff_required
+def import_marks(exam_id):
+    """Import marks for an exam from a CSV or XLSX file."""
+    exam = Exam.query.get_or_404(exam_id)
+    staff = current_user.staff
+
+    if exam.created_by != staff.id:
+        flash('You do not have permission to enter marks for this exam.', 'danger')
+        return redirect(url_for('marks.manage'))
+
+    report = None
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if not file or not file.filename:
+            flash('Please choose a file to upload.', 'warning')
+            return redirect(url_for('marks.import_marks', exam_id=exam.id))
+
+        try:
+            report = MarksImport.import_exam_marks(exam, MarksImport.iter_rows(file))
+        except MarksImportError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('marks.import_marks', exam_id=exam.id))
+        MarksService.refresh_result_summaries(student.id for student in report['updated'])
+        if report['updated']:
+            RankService.refresh_for_exam(exam)
+            MarksAnalytics.refresh([exam.subject_id])
+        db.session.commit()
+
+        if report['error_count']:
+            flash(f"Imported marks for {report['imported']} students; "
+                  f"{report['error_count']} rows had errors.", 'warning')
+        else:
+            flash(f"Imported marks for {report['imported']} students.", 'success')
+
+    return render_template('marks/import.html', exam=exam, report=report)
+
+
+@bp.route('/publish/<int:exam_id>', methods=['POST'])
+@login_required
+@staff_required
+def publish_results(exam_id):
+    """Queue a background job notifying students of an exam's results."""
+    exam = Exam.query.get_or_404(exam_id)
+    staff = current_user.staff
+
+    if exam.created_by != staff.id:
+        flash('You do not have permission to publish results for this exam.', 'danger')
+        return redirect(url_for('marks.manage'))
+
+    if JobQueue.active_job('publish_results', 'exam', exam.id):
+        flash('Results for this exam are already being published.', 'info')
+    elif not exam.marks.first():
+        flash('Enter marks before publishing results.', 'warning')
+    else:
+        JobQueue.enqueue('publish_results', 'exam', exam.id, created_by=current_user.id)
+        flash(f'Publishing results for {exam.name}. Students will be notified shortly.', 'success')
+
+    return redirect(url_for('marks.manage'))
+
+
+@bp.route('/jobs/<int:job_id>')
+@login_required
+@staff_required
+def job_status(job_id):
+    """Progress of a background job, as JSON."""
+    job = BackgroundJob.query.get_or_404(job_id)
+    if job.created_by != current_user.id:
+        abort(403)
+    return jsonify({
+        'id': job.id,
+        'status': job.status,
+        'processed': job.processed,
+        'total': job.total,
+        'progress': job.progress,
+        'error': job.error
+    })
+
+
 @bp.route('/edit/<int:exam_id>', methods=['GET', 'POST'])
 @login_required
 @staff_required
@@ -144,12 +235,13 @@ def edit_exam(exam_id):
     form.submit.label.text = 'Update Exam'
 
     # Populate subject choices - all subjects
-    all_subjects = Subject.query.all()
-    form.subject_id.choices = [
-        (s.id, f'{s.code} - {s.name}') for s in all_subjects
-    ]
+    form.subject_id.choices = ReferenceData.subject_choices()
 
     if form.validate_on_submit():
+        previous_scope = (exam.department_id, exam.subject.semester)
+        previous_subject_id = exam.subject_id
+        results_changed = (exam.max_marks != form.max_marks.data
+                           or exam.subject_id != form.subject_id.data)
         exam.name = form.name.data
         exam.exam_type = form.exam_type.data
         exam.subject_id = form.subject_id.data
@@ -157,6 +249,17 @@ def edit_exam(exam_id):
         exam.date = form.date.data
         exam.year = form.year.data
         exam.section = form.section.data
+        if results_changed:
+            db.session.flush()
+            MarksService.refresh_result_summaries(
+                row[0] for row in db.session.query(Marks.student_id).filter_by(exam_id=exam.id)
+            )
+        # Exam ranks are grouped by name and type across sections, so refresh on any edit
+        db.session.expire(exam, ['subject'])
+        if previous_scope != (exam.department_id, exam.subject.semester):
+            RankService.refresh(*previous_scope)
+        RankService.refresh_for_exam(exam)
+        MarksAnalytics.refresh({previous_subject_id, exam.subject_id})
         db.session.commit()
 
         flash('Exam updated successfully.', 'success')
@@ -178,8 +281,16 @@ def delete_exam(exam_id):
         return redirect(url_for('marks.manage'))
 
     # Delete associated marks first
+    student_ids = [row[0] for row in db.session.query(Marks.student_id).filter_by(exam_id=exam.id)]
+    scope = (exam.department_id, exam.subject.semester)
+    StudentRank.query.filter_by(exam_id=exam.id).delete()
+    ExamStatistics.query.filter_by(exam_id=exam.id).delete()
     Marks.query.filter_by(exam_id=exam.id).delete()
     db.session.delete(exam)
+    db.session.flush()
+    MarksService.refresh_result_summaries(student_ids)
+    RankService.refresh(*scope)
+    MarksAnalytics.refresh([exam.subject_id])
     db.session.commit()
 
     flash('Exam deleted successfully.', 'success')
@@ -192,8 +303,131 @@ def delete_exam(exam_id):
 def reports():
     """View marks reports."""
     staff = current_user.staff
-    exams = Exam.query.filter_by(created_by=staff.id).order_by(Exam.date.desc()).all()
-    return render_template('marks/reports.html', exams=exams)
+    page = request.args.get('page', 1, type=int)
+
+    exams = MarksService.staff_exams_query(staff.id).paginate(
+        page=page, per_page=EXAMS_PER_PAGE, error_out=False
+    )
+
+    # Marks of every exam on the page, with students, in one query
+    marks_by_exam = {exam.id: [] for exam in exams.items}
+    if marks_by_exam:
+        marks = Marks.query.join(Marks.student).options(
+            contains_eager(Marks.student)
+        ).filter(Marks.exam_id.in_(marks_by_exam)).order_by(Student.roll_number).all()
+        for mark in marks:
+            marks_by_exam[mark.exam_id].append(mark)
+
+    schemes = MarksService.load_schemes()
+    reports = [{
+        'exam': exam,
+        'marks': marks_by_exam[exam.id],
+        'stats': MarksAnalytics.exam_statistics(exam, marks_by_exam[exam.id], schemes)
+    } for exam in exams.items]
+
+    return render_template('marks/reports.html', reports=reports, pagination=exams)
+
+
+@bp.route('/export')
+@login_required
+@role_required('staff', 'hod', 'management')
+def export():
+    """Export marks as a streamed CSV or XLSX file."""
+    if current_user.is_management():
+        departments = ReferenceData.departments()
+        department_id = request.args.get('department_id', type=int)
+    else:
+        departments = [current_user.staff.department]
+        department_id = current_user.staff.department_id
+
+    file_format = request.args.get('format')
+    if file_format not in ('csv', 'xlsx'):
+        return render_template('marks/export.html', departments=departments)
+
+    stmt = MarksExport.build_query(
+        department_id=department_id,
+        year=request.args.get('year', type=int),
+        section=request.args.get('section', ''),
+        exam_type=request.args.get('exam_type', ''),
+        date_from=request.args.get('date_from', type=date.fromisoformat),
+        date_to=request.args.get('date_to', type=date.fromisoformat),
+        # Staff export only the exams they created
+        created_by=None if current_user.is_hod() or current_user.is_management()
+        else current_user.staff.id
+    )
+
+    filename = f'marks_{date.today():%Y%m%d}.{file_format}'
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    if file_format == 'xlsx':
+        if not MarksExport.xlsx_available():
+            flash('XLSX export requires the openpyxl package.', 'danger')
+            return redirect(url_for('marks.export'))
+        return Response(
+            stream_with_context(MarksExport.iter_xlsx(stmt)),
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            headers=headers
+        )
+    return Response(stream_with_context(MarksExport.iter_csv(stmt)),
+                    mimetype='text/csv', headers=headers)
+
+
+@bp.route('/rankings')
+@login_required
+@role_required('management', 'hod')
+def rankings():
+    """Semester (SGPA) and exam ranks of a department."""
+    if current_user.is_hod():
+        departments = [current_user.staff.department]
+        department_id = current_user.staff.department_id
+    else:
+        departments = ReferenceData.departments()
+        department_id = request.args.get('department_id', type=int)
+    semester = request.args.get('semester', type=int)
+    exam_id = request.args.get('exam_id', type=int)
+    section = request.args.get('section', '')
+    page = request.args.get('page', 1, type=int)
+
+    exams = []
+    ranks = None
+    if department_id and semester:
+        exams = Exam.query.join(Subject).options(contains_eager(Exam.subject)).filter(
+            Exam.department_id == department_id,
+            Subject.semester == semester
+        ).order_by(Exam.date.desc(), Exam.id.desc()).all()
+
+        ranks = RankService.ranks_query(department_id, semester, exam_id, section).paginate(
+            page=page, per_page=RANKS_PER_PAGE, error_out=False
+        )
+
+    return render_template('marks/rankings.html',
+                           departments=departments,
+                           exams=exams,
+                           ranks=ranks)
+
+
+@bp.route('/exam-review')
+@login_required
+@hod_required
+def exam_review():
+    """Cached statistics and anomaly flags of the department's exams."""
+    department_id = current_user.staff.department_id
+    semester = request.args.get('semester', type=int)
+    flagged_only = request.args.get('flagged') == '1'
+    page = request.args.get('page', 1, type=int)
+
+    query = ExamStatistics.query.join(ExamStatistics.exam).join(Exam.subject).options(
+        contains_eager(ExamStatistics.exam).contains_eager(Exam.subject)
+    ).filter(ExamStatistics.department_id == department_id)
+    if semester:
+        query = query.filter(Subject.semester == semester)
+    if flagged_only:
+        query = query.filter(ExamStatistics.anomaly_count > 0)
+
+    statistics = query.order_by(
+        ExamStatistics.anomaly_count.desc(), Exam.date.desc(), Exam.id.desc()
+    ).paginate(page=page, per_page=REVIEW_PER_PAGE, error_out=False)
+
+    return render_template('marks/exam_review.html', statistics=statistics)
 
 
 @bp.route('/my-results')
@@ -203,18 +437,17 @@ def my_results():
     """View own results."""
     student = current_user.student
 
-    marks = Marks.query.filter_by(student_id=student.id).order_by(
-        Marks.entered_at.desc()
-    ).all()
+    summaries = MarksService.result_summaries_query(student.id).all()
+
+    # Marks with their exams and subjects in one joined query
+    marks = MarksService.student_marks_query(student.id).all()
 
     # Group by subject
     results_by_subject = {}
     for mark in marks:
-        subject_name = mark.exam.subject.name
-        if subject_name not in results_by_subject:
-            results_by_subject[subject_name] = []
-        results_by_subject[subject_name].append(mark)
+        results_by_subject.setdefault(mark.exam.subject.name, []).append(mark)
 
     return render_template('marks/my_results.html',
                            student=student,
+                           summaries=summaries,
                            results_by_subject=results_by_subject)
@@ -1,9 +1,10 @@
 from flask import render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from . import bp
-from ...models import Timetable, PeriodTiming, Subject, Staff, Department
+from ...models import Timetable, Department
 from ...extensions import db
 from ...utils.decorators import staff_required, student_required
+from ...services.reference_data import ReferenceData
 from flask_wtf import FlaskForm
 from wtforms import SelectField, StringField, SubmitField
 from wtforms.validators import DataRequired, Length
@@ -48,7 +49,7 @@ def my_timetable():
     for entry in timetable:
         days[entry.day_of_week].append(entry)
 
-    period_timings = PeriodTiming.query.order_by(PeriodTiming.period).all()
+    period_timings = ReferenceData.period_timings()
 
     return render_template('timetable/my_timetable.html',
                            student=student,
@@ -73,7 +74,7 @@ def staff_schedule():
     for entry in timetable:
         days[entry.day_of_week].append(entry)
 
-    period_timings = PeriodTiming.query.order_by(PeriodTiming.period).all()
+    period_timings = ReferenceData.period_timings()
 
     return render_template('timetable/staff_schedule.html',
                            staff=staff,
@@ -89,14 +90,9 @@ def create():
     form = TimetableEntryForm()
 
     # Populate choices
-    departments = Department.query.all()
-    form.department_id.choices = [(d.id, d.name) for d in departments]
-
-    subjects = Subject.query.all()
-    form.subject_id.choices = [(s.id, f'{s.code} - {s.name}') for s in subjects]
-
-    staff_members = Staff.query.all()
-    form.staff_id.choices = [(s.id, s.name) for s in staff_members]
+    form.department_id.choices = ReferenceData.department_choices()
+    form.subject_id.choices = ReferenceData.subject_choices()
+    form.staff_id.choices = ReferenceData.staff_choices()
 
     if form.validate_on_submit():
         # Check for conflict
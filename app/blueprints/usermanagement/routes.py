@@ -5,6 +5,7 @@ from .forms import HODRegistrationForm, HODEditForm, StaffRegistrationForm, Staf
 from ...models import User, Staff, Department, Subject, Student, StaffAssignment
 from ...extensions import db
 from ...utils.decorators import management_required, hod_required, staff_required
+from ...services.reference_data import ReferenceData
 from datetime import date
 
 
@@ -25,8 +26,7 @@ def hod_list():
 def create_hod():
     """Create a new HOD (Management only)."""
     form = HODRegistrationForm()
-    departments = Department.query.all()
-    form.department_id.choices = [(d.id, d.name) for d in departments]
+    form.department_id.choices = ReferenceData.department_choices()
 
     if form.validate_on_submit():
         if User.query.filter_by(username=form.username.data).first():
@@ -66,6 +66,7 @@ def create_hod():
         department = Department.query.get(form.department_id.data)
         department.hod_id = staff.id
         db.session.commit()
+        ReferenceData.invalidate('staff')
 
         flash(f'HOD {staff.name} created successfully.', 'success')
         return redirect(url_for('usermanagement.hod_list'))
@@ -85,8 +86,7 @@ def edit_hod(id):
 
     staff = user.staff
     form = HODEditForm(obj=staff)
-    departments = Department.query.all()
-    form.department_id.choices = [(d.id, d.name) for d in departments]
+    form.department_id.choices = ReferenceData.department_choices()
 
     if request.method == 'GET':
         form.username.data = user.username
@@ -138,6 +138,7 @@ def edit_hod(id):
         staff.joining_date = form.joining_date.data
 
         db.session.commit()
+        ReferenceData.invalidate('staff')
         flash(f'HOD {staff.name} updated successfully.', 'success')
         return redirect(url_for('usermanagement.hod_list'))
 
@@ -164,6 +165,7 @@ def delete_hod(id):
 
     db.session.delete(user)
     db.session.commit()
+    ReferenceData.invalidate('staff')
 
     flash(f'HOD {name} deleted successfully.', 'success')
     return redirect(url_for('usermanagement.hod_list'))
@@ -225,6 +227,7 @@ def create_staff():
         )
         db.session.add(staff)
         db.session.commit()
+        ReferenceData.invalidate('staff')
 
         flash(f'Staff {staff.name} created successfully.', 'success')
         return redirect(url_for('usermanagement.staff_list'))
@@ -285,6 +288,7 @@ def edit_staff(id):
         staff.joining_date = form.joining_date.data
 
         db.session.commit()
+        ReferenceData.invalidate('staff')
         flash(f'Staff {staff.name} updated successfully.', 'success')
         return redirect(url_for('usermanagement.staff_list'))
 
@@ -311,6 +315,7 @@ def delete_staff(id):
     name = staff.name
     db.session.delete(user)
     db.session.commit()
+    ReferenceData.invalidate('staff')
 
     flash(f'Staff {name} deleted successfully.', 'success')
     return redirect(url_for('usermanagement.staff_list'))
@@ -352,6 +357,7 @@ def create_subject():
         )
         db.session.add(subject)
         db.session.commit()
+        ReferenceData.invalidate('subjects')
 
         flash(f'Subject {subject.name} created successfully.', 'success')
         return redirect(url_for('usermanagement.subject_list'))
@@ -387,6 +393,7 @@ def edit_subject(id):
         subject.is_lab = form.is_lab.data
 
         db.session.commit()
+        ReferenceData.invalidate('subjects')
         flash(f'Subject {subject.name} updated successfully.', 'success')
         return redirect(url_for('usermanagement.subject_list'))
 
@@ -408,6 +415,7 @@ def delete_subject(id):
     name = subject.name
     db.session.delete(subject)
     db.session.commit()
+    ReferenceData.invalidate('subjects')
 
     flash(f'Subject {name} deleted successfully.', 'success')
     return redirect(url_for('usermanagement.subject_list'))
@@ -442,6 +450,7 @@ def create_department():
         )
         db.session.add(department)
         db.session.commit()
+        ReferenceData.invalidate('departments')
 
         flash(f'Department {department.name} created successfully.', 'success')
         return redirect(url_for('usermanagement.department_list'))
@@ -466,6 +475,7 @@ def edit_department(id):
         department.code = form.code.data.upper()
         department.name = form.name.data
         db.session.commit()
+        ReferenceData.invalidate('departments')
 
         flash(f'Department {department.name} updated successfully.', 'success')
         return redirect(url_for('usermanagement.department_list'))
@@ -492,6 +502,7 @@ def delete_department(id):
     name = department.name
     db.session.delete(department)
     db.session.commit()
+    ReferenceData.invalidate('departments')
 
     flash(f'Department {name} deleted successfully.', 'success')
     return redirect(url_for('usermanagement.department_list'))
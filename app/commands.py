@@ -0,0 +1,54 @@
+import click
+from flask.cli import with_appcontext
+from .services.index_audit import IndexAudit
+from .services.job_queue import JobQueue
+from .services.schema_upgrade import SchemaUpgrade
+
+
+@click.command('index-audit')
+@click.option('--create-missing', is_flag=True,
+              help='Create indexes declared on the models but missing from the database.')
+@click.option('--verbose', '-v', is_flag=True, help='Print the full plan of every query.')
+@with_appcontext
+def index_audit(create_missing, verbose):
+    """Explain the hot attendance and marks queries and flag full table scans."""
+    if create_missing:
+        for name in IndexAudit.create_missing_indexes():
+            click.echo(f'Created index {name}')
+
+    try:
+        results = IndexAudit.run()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+    flagged = 0
+    for label, plan, scans in results:
+        if scans:
+            flagged += 1
+            click.echo(f'[SCAN] {label}: full scan of {", ".join(scans)}')
+        else:
+            click.echo(f'[ OK ] {label}')
+        if verbose or scans:
+            for line in plan:
+                click.echo(f'         {line}')
+
+    click.echo(f'{flagged} of {len(results)} queries use a full table scan.')
+
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db():
+    """Add columns and indexes introduced since an existing database was created."""
+    for name in SchemaUpgrade.upgrade():
+        click.echo(f'Added column {name}')
+    for name in IndexAudit.create_missing_indexes():
+        click.echo(f'Created index {name}')
+    click.echo('Database is up to date.')
+
+
+@click.command('run-jobs')
+@with_appcontext
+def run_jobs():
+    """Run queued background jobs now, e.g. after a server restart."""
+    count = JobQueue.run_pending()
+    click.echo(f'Ran {count} queued jobs.')
@@ -8,3 +8,9 @@ class Config:
     WTF_CSRF_ENABLED = True
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
+    # Threads running background jobs such as result publication
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or 2)
+    # Seconds after which a job still 'running' is presumed dead (e.g. its server restarted)
+    JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER') or 3600)
+    # Seconds departments, subjects, staff and period timings stay cached for form choices
+    REFERENCE_CACHE_TTL = int(os.environ.get('REFERENCE_CACHE_TTL') or 300)
@@ -1,25 +1,34 @@
 from .user import User, Student, Staff, Management
 from .academic import Department, Subject, StaffAssignment
-from .attendance import AttendanceSession, AttendanceRecord, AttendanceSummary
-from .marks import Exam, Marks
-from .fees import FeeStructure, StudentFees
+from .attendance import (
+    AttendanceSession, AttendanceRecord, AttendanceSummary, AttendanceAlert,
+    AttendanceSessionArchive, AttendanceRecordArchive, AttendanceSummarySnapshot
+)
+from .marks import (
+    Exam, Marks, GradingScheme, GradeBand, StudentResultSummary, StudentRank, ExamStatistics
+)
+from .fees import FeeStructure, StudentFees, FeePayment
 from .library import Book, BookIssue
 from .complaint import Complaint, ComplaintResponse
 from .feedback import Feedback
 from .notice import Notice
 from .timetable import Timetable, PeriodTiming
 from .notification import Notification
+from .job import BackgroundJob
 
 __all__ = [
     'User', 'Student', 'Staff', 'Management',
     'Department', 'Subject', 'StaffAssignment',
-    'AttendanceSession', 'AttendanceRecord', 'AttendanceSummary',
-    'Exam', 'Marks',
-    'FeeStructure', 'StudentFees',
+    'AttendanceSession', 'AttendanceRecord', 'AttendanceSummary', 'AttendanceAlert',
+    'AttendanceSessionArchive', 'AttendanceRecordArchive', 'AttendanceSummarySnapshot',
+    'Exam', 'Marks', 'GradingScheme', 'GradeBand', 'StudentResultSummary', 'StudentRank',
+    'ExamStatistics',
+    'FeeStructure', 'StudentFees', 'FeePayment',
     'Book', 'BookIssue',
     'Complaint', 'ComplaintResponse',
     'Feedback',
     'Notice',
     'Timetable', 'PeriodTiming',
-    'Notification'
+    'Notification',
+    'BackgroundJob'
 ]
@@ -13,6 +13,7 @@ class AttendanceSession(db.Model):
     year = db.Column(db.Integer, nullable=False)
     section = db.Column(db.String(1), nullable=False)
     department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped on every marking save
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -22,6 +23,11 @@ class AttendanceSession(db.Model):
     __table_args__ = (
         db.UniqueConstraint('subject_id', 'date', 'period', 'section', 'department_id',
                             name='unique_session'),
+        # Staff listings (reports, today) ordered by date
+        db.Index('ix_attendance_sessions_staff_date', 'staff_id', 'date', 'id'),
+        # Class-wide scans (analytics, archive)
+        db.Index('ix_attendance_sessions_class', 'department_id', 'year', 'section', 'date'),
+        db.Index('ix_attendance_sessions_date', 'date'),
     )
 
 
@@ -35,6 +41,8 @@ class AttendanceRecord(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('session_id', 'student_id', name='unique_attendance_record'),
+        # Covers per-student history lookups without touching the table
+        db.Index('ix_attendance_records_student', 'student_id', 'session_id', 'is_present'),
     )
 
 
@@ -49,8 +57,12 @@ class AttendanceSummary(db.Model):
     percentage = db.Column(db.Float, default=0.0)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Relationships
+    subject = db.relationship('Subject')
+
     __table_args__ = (
         db.UniqueConstraint('student_id', 'subject_id', name='unique_summary'),
+        db.Index('ix_attendance_summary_subject', 'subject_id', 'percentage'),
     )
 
     def update_percentage(self):
@@ -58,3 +70,75 @@ class AttendanceSummary(db.Model):
             self.percentage = (self.attended / self.total_classes) * 100
         else:
             self.percentage = 0.0
+
+
+class AttendanceAlert(db.Model):
+    __tablename__ = 'attendance_alerts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
+    band = db.Column(db.Integer, nullable=False)  # threshold crossed: 75, 65, 50
+    percentage = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'subject_id', 'band', name='unique_attendance_alert'),
+    )
+
+
+# Closed-term data moved out of the hot attendance tables; read-only
+class AttendanceSessionArchive(db.Model):
+    __tablename__ = 'attendance_sessions_archive'
+
+    id = db.Column(db.Integer, primary_key=True)
+    original_id = db.Column(db.Integer, nullable=False)  # Session id in the hot table; reused after archiving
+    term = db.Column(db.String(20), nullable=False, index=True)  # e.g. 2025-26 Odd
+    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
+    staff_id = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    period = db.Column(db.Integer, nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    section = db.Column(db.String(1), nullable=False)
+    department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=False)
+    created_at = db.Column(db.DateTime)
+
+    # Relationships
+    subject = db.relationship('Subject')
+    records = db.relationship('AttendanceRecordArchive', backref='session', lazy='dynamic')
+
+    __table_args__ = (
+        # Maps hot session ids to archive ids while a term is being archived
+        db.Index('ix_attendance_sessions_archive_original', 'term', 'original_id'),
+    )
+
+
+class AttendanceRecordArchive(db.Model):
+    __tablename__ = 'attendance_records_archive'
+
+    id = db.Column(db.Integer, primary_key=True)
+    original_id = db.Column(db.Integer, nullable=False)  # Record id in the hot table
+    session_id = db.Column(db.Integer, db.ForeignKey('attendance_sessions_archive.id'),
+                           nullable=False, index=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False, index=True)
+    is_present = db.Column(db.Boolean, default=False)
+
+
+class AttendanceSummarySnapshot(db.Model):
+    __tablename__ = 'attendance_summary_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    term = db.Column(db.String(20), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
+    total_classes = db.Column(db.Integer, default=0)
+    attended = db.Column(db.Integer, default=0)
+    percentage = db.Column(db.Float, default=0.0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationships
+    subject = db.relationship('Subject')
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'subject_id', 'term', name='unique_summary_snapshot'),
+    )
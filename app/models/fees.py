@@ -26,16 +26,24 @@ class StudentFees(db.Model):
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
     fee_structure_id = db.Column(db.Integer, db.ForeignKey('fee_structure.id'), nullable=False)
     amount_due = db.Column(db.Float, nullable=False)
-    amount_paid = db.Column(db.Float, default=0.0)
+    amount_paid = db.Column(db.Float, default=0.0)  # Cached sum of the FeePayment ledger
     payment_status = db.Column(db.String(20), default='pending')  # pending, partial, paid
-    payment_date = db.Column(db.DateTime)
+    payment_date = db.Column(db.DateTime)  # Last ledger entry
     transaction_id = db.Column(db.String(50))
     remarks = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Relationships
+    payments = db.relationship('FeePayment', backref='student_fee', lazy='dynamic',
+                               order_by='FeePayment.id')
+
     __table_args__ = (
         db.UniqueConstraint('student_id', 'fee_structure_id', name='unique_student_fee'),
+        # Pending fees report
+        db.Index('ix_student_fees_status', 'payment_status', 'fee_structure_id'),
+        # Student fees list, newest first
+        db.Index('ix_student_fees_created', 'created_at', 'id'),
     )
 
     def update_status(self):
@@ -49,3 +57,21 @@ class StudentFees(db.Model):
     @property
     def balance(self):
         return self.amount_due - self.amount_paid
+
+
+class FeePayment(db.Model):
+    __tablename__ = 'fee_payments'
+
+    # Append-only: corrections are posted as new entries, never by editing rows
+    id = db.Column(db.Integer, primary_key=True)
+    student_fee_id = db.Column(db.Integer, db.ForeignKey('student_fees.id'), nullable=False)
+    entry_type = db.Column(db.String(20), nullable=False)  # payment, refund, opening
+    amount = db.Column(db.Float, nullable=False)  # Signed: refunds are negative
+    transaction_id = db.Column(db.String(50))
+    remarks = db.Column(db.String(200))
+    recorded_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_fee_payments_student_fee', 'student_fee_id', 'id'),
+    )
@@ -0,0 +1,34 @@
+from datetime import datetime
+from ..extensions import db
+
+
+class BackgroundJob(db.Model):
+    __tablename__ = 'background_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(30), nullable=False)  # publish_results
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    reference_type = db.Column(db.String(30))  # exam
+    reference_id = db.Column(db.Integer)
+    total = db.Column(db.Integer, default=0)
+    processed = db.Column(db.Integer, default=0)
+    error = db.Column(db.String(500))
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_background_jobs_reference', 'reference_type', 'reference_id', 'job_type'),
+        db.Index('ix_background_jobs_status', 'status'),
+    )
+
+    @property
+    def is_active(self):
+        return self.status in ('queued', 'running')
+
+    @property
+    def progress(self):
+        if not self.total:
+            return 100 if self.status == 'completed' else 0
+        return int(self.processed * 100 / self.total)
@@ -1,7 +1,14 @@
+from bisect import bisect_right
 from datetime import datetime
 from ..extensions import db
 
 
+# Default grade bands as (minimum percentage, grade), ascending
+DEFAULT_GRADE_BANDS = (
+    (0, 'F'), (40, 'C'), (50, 'B'), (60, 'B+'), (70, 'A'), (80, 'A+'), (90, 'O')
+)
+
+
 class Exam(db.Model):
     __tablename__ = 'exams'
 
@@ -21,6 +28,11 @@ class Exam(db.Model):
     marks = db.relationship('Marks', backref='exam', lazy='dynamic', cascade='all, delete-orphan')
     creator = db.relationship('Staff', backref='created_exams')
 
+    __table_args__ = (
+        db.Index('ix_exams_created_by_date', 'created_by', 'date'),
+        db.Index('ix_exams_subject', 'subject_id', 'date'),
+    )
+
 
 class Marks(db.Model):
     __tablename__ = 'marks'
@@ -35,25 +47,127 @@ class Marks(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('exam_id', 'student_id', name='unique_marks'),
+        db.Index('ix_marks_student', 'student_id', 'exam_id'),
     )
 
-    def calculate_grade(self, max_marks):
+    def calculate_grade(self, max_marks, bands=DEFAULT_GRADE_BANDS):
         if self.marks_obtained is None:
             self.grade = 'AB'  # Absent
             return
 
         percentage = (self.marks_obtained / max_marks) * 100
-        if percentage >= 90:
-            self.grade = 'O'
-        elif percentage >= 80:
-            self.grade = 'A+'
-        elif percentage >= 70:
-            self.grade = 'A'
-        elif percentage >= 60:
-            self.grade = 'B+'
-        elif percentage >= 50:
-            self.grade = 'B'
-        elif percentage >= 40:
-            self.grade = 'C'
-        else:
-            self.grade = 'F'
+        index = bisect_right([minimum for minimum, _ in bands], percentage) - 1
+        self.grade = bands[max(index, 0)][1]
+
+
+class GradingScheme(db.Model):
+    __tablename__ = 'grading_schemes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    # Scope; NULL matches any. The most specific matching scheme applies to an exam.
+    department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=True)
+    exam_type = db.Column(db.String(20), nullable=True)  # assignment, internal, final
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationships
+    bands = db.relationship('GradeBand', backref='scheme', order_by='GradeBand.min_percentage',
+                            cascade='all, delete-orphan')
+    department = db.relationship('Department')
+
+    @classmethod
+    def scope_key(cls):
+        """Scope columns with NULL (any) replaced by sentinels, as indexed by unique_grading_scope."""
+        return [db.func.coalesce(cls.department_id, db.literal_column('0')),
+                db.func.coalesce(cls.exam_type, db.literal_column("''"))]
+
+    def band_tuples(self):
+        return tuple((band.min_percentage, band.grade) for band in self.bands)
+
+
+# A plain unique constraint treats NULL scopes as distinct, so "any" scopes could repeat
+db.Index('unique_grading_scope', *GradingScheme.scope_key(), unique=True)
+
+
+class GradeBand(db.Model):
+    __tablename__ = 'grade_bands'
+
+    id = db.Column(db.Integer, primary_key=True)
+    scheme_id = db.Column(db.Integer, db.ForeignKey('grading_schemes.id'), nullable=False)
+    min_percentage = db.Column(db.Float, nullable=False)
+    grade = db.Column(db.String(2), nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('scheme_id', 'min_percentage', name='unique_grade_band'),
+    )
+
+
+class StudentResultSummary(db.Model):
+    __tablename__ = 'student_result_summaries'
+
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    semester = db.Column(db.Integer, nullable=False)  # Subject semester, 1-8
+    subjects = db.Column(db.Integer, default=0)
+    credits = db.Column(db.Integer, default=0)
+    credit_points = db.Column(db.Float, default=0.0)  # Sum of credits x grade point
+    sgpa = db.Column(db.Float, default=0.0)
+    cgpa = db.Column(db.Float, default=0.0)  # Cumulative up to and including this semester
+    last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'semester', name='unique_result_summary'),
+    )
+
+
+class StudentRank(db.Model):
+    __tablename__ = 'student_ranks'
+
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    exam_id = db.Column(db.Integer, db.ForeignKey('exams.id'), nullable=True)  # NULL for semester (SGPA) ranks
+    semester = db.Column(db.Integer, nullable=False)
+    department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=False)
+    score = db.Column(db.Float, nullable=False)  # Exam percentage or SGPA
+    section_rank = db.Column(db.Integer, nullable=False)  # Dense rank, 1 = top
+    section_percentile = db.Column(db.Float, nullable=False)  # 100 = top, 0 = bottom
+    department_rank = db.Column(db.Integer, nullable=False)
+    department_percentile = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationships
+    student = db.relationship('Student')
+    exam = db.relationship('Exam')
+
+    __table_args__ = (
+        db.Index('ix_student_ranks_scope', 'department_id', 'semester', 'exam_id', 'department_rank'),
+        db.Index('ix_student_ranks_student', 'student_id', 'semester'),
+        db.Index('ix_student_ranks_exam', 'exam_id'),
+    )
+
+
+class ExamStatistics(db.Model):
+    __tablename__ = 'exam_statistics'
+
+    id = db.Column(db.Integer, primary_key=True)
+    exam_id = db.Column(db.Integer, db.ForeignKey('exams.id'), nullable=False, unique=True)
+    department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=False)
+    count = db.Column(db.Integer, default=0)
+    appeared = db.Column(db.Integer, default=0)
+    mean = db.Column(db.Float)  # NULL when nobody appeared
+    median = db.Column(db.Float)
+    std = db.Column(db.Float)
+    lowest = db.Column(db.Float)
+    highest = db.Column(db.Float)
+    mean_percentage = db.Column(db.Float)
+    pass_rate = db.Column(db.Float)
+    anomalies = db.Column(db.JSON, default=list)  # List of {'type': ..., 'message': ...}
+    anomaly_count = db.Column(db.Integer, default=0)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationships
+    exam = db.relationship('Exam')
+
+    __table_args__ = (
+        db.Index('ix_exam_statistics_department', 'department_id', 'anomaly_count'),
+    )
@@ -17,5 +17,10 @@ class Notification(db.Model):
     reference_id = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Duplicate checks when results are published again
+        db.Index('ix_notifications_reference', 'reference_type', 'reference_id', 'notification_type'),
+    )
+
     def mark_as_read(self):
         self.is_read = True
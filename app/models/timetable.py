@@ -21,6 +21,8 @@ class Timetable(db.Model):
     __table_args__ = (
         db.UniqueConstraint('department_id', 'year', 'section', 'day_of_week', 'period',
                             name='unique_timetable_slot'),
+        db.Index('ix_timetable_day', 'day_of_week', 'period'),
+        db.Index('ix_timetable_staff', 'staff_id', 'day_of_week'),
     )
 
     @staticmethod
@@ -78,6 +78,11 @@ class Student(db.Model):
     complaints = db.relationship('Complaint', backref='student', lazy='dynamic')
     feedbacks = db.relationship('Feedback', backref='student', lazy='dynamic')
 
+    __table_args__ = (
+        # Class lists for attendance and marks entry
+        db.Index('ix_students_class', 'department_id', 'year', 'section', 'roll_number'),
+    )
+
 
 class Staff(db.Model):
     __tablename__ = 'staff'
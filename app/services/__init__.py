@@ -1,3 +1,16 @@
 from .notification_service import NotificationService
+from .attendance_service import AttendanceService
+from .attendance_analytics import AttendanceAnalytics
+from .attendance_archive import AttendanceArchive
+from .marks_service import MarksService
+from .marks_import import MarksImport
+from .rank_service import RankService
+from .marks_analytics import MarksAnalytics
+from .job_queue import JobQueue
+from .reference_data import ReferenceData
+from .fee_service import FeeService
+from .fee_reconciliation import FeeReconciliation
 
-__all__ = ['NotificationService']
+__all__ = ['NotificationService', 'AttendanceService', 'AttendanceAnalytics', 'AttendanceArchive',
+           'MarksService', 'MarksImport', 'RankService', 'MarksAnalytics',
+           'JobQueue', 'ReferenceData', 'FeeService', 'FeeReconciliation']
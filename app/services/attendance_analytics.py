@@ -0,0 +1,224 @@
+import numpy as np
+from sqlalchemy import func
+from ..extensions import db
+from ..models import AttendanceSession, AttendanceRecord, Student, Subject
+from .attendance_service import LOW_ATTENDANCE_THRESHOLD
+
+
+class AttendanceMatrix:
+    """
+    Presence of every student of a section in every session of that section.
+    Rows follow `student_ids`, columns follow `session_ids`; `marked` is False
+    where a student has no record for a session (e.g. admitted later).
+    """
+
+    def __init__(self, student_ids, roll_numbers, names, session_ids,
+                 subject_ids, dates, periods, present, marked):
+        self.student_ids = student_ids
+        self.roll_numbers = roll_numbers
+        self.names = names
+        self.session_ids = session_ids
+        self.subject_ids = subject_ids
+        self.dates = dates
+        self.periods = periods
+        self.present = present
+        self.marked = marked
+
+    @property
+    def absent(self):
+        return self.marked & ~self.present
+
+    @property
+    def weekdays(self):
+        """Day of week per session, 0=Monday to 6=Sunday."""
+        return (self.dates.astype('datetime64[D]').astype(np.int64) + 3) % 7
+
+
+class AttendanceAnalytics:
+    @staticmethod
+    def class_sessions_query(department_id, year, section):
+        """(id, subject_id, date, period) of every session of a section, by id."""
+        return db.session.query(
+            AttendanceSession.id, AttendanceSession.subject_id,
+            AttendanceSession.date, AttendanceSession.period
+        ).filter_by(
+            department_id=department_id, year=year, section=section
+        ).order_by(AttendanceSession.id)
+
+    @staticmethod
+    def load_matrix(department_id, year, section):
+        """Load the (student x session) presence matrix for a section in three queries."""
+        students = db.session.query(
+            Student.id, Student.roll_number, Student.name
+        ).filter_by(
+            department_id=department_id, year=year, section=section
+        ).order_by(Student.id).all()
+
+        sessions = AttendanceAnalytics.class_sessions_query(department_id, year, section).all()
+
+        records = db.session.query(
+            AttendanceRecord.student_id,
+            AttendanceRecord.session_id,
+            func.coalesce(AttendanceRecord.is_present, False)
+        ).join(AttendanceSession).filter(
+            AttendanceSession.department_id == department_id,
+            AttendanceSession.year == year,
+            AttendanceSession.section == section
+        ).all()
+
+        student_ids = np.array([s[0] for s in students], dtype=np.int64)
+        session_ids = np.array([s[0] for s in sessions], dtype=np.int64)
+        present = np.zeros((len(student_ids), len(session_ids)), dtype=bool)
+        marked = np.zeros_like(present)
+
+        if records and len(student_ids) and len(session_ids):
+            data = np.array(records, dtype=np.int64)
+            # Both id arrays are sorted, so positions come from a binary search
+            rows = np.searchsorted(student_ids, data[:, 0])
+            cols = np.searchsorted(session_ids, data[:, 1])
+            # Drop records of students who have since moved out of the section
+            clipped = np.minimum(rows, len(student_ids) - 1)
+            valid = student_ids[clipped] == data[:, 0]
+            rows, cols, flags = clipped[valid], cols[valid], data[valid, 2].astype(bool)
+            marked[rows, cols] = True
+            present[rows, cols] = flags
+
+        # Order sessions chronologically
+        dates = np.array([s[2] for s in sessions], dtype='datetime64[D]')
+        periods = np.array([s[3] for s in sessions], dtype=np.int64)
+        order = np.lexsort((periods, dates))
+
+        return AttendanceMatrix(
+            student_ids=student_ids,
+            roll_numbers=[s[1] for s in students],
+            names=[s[2] for s in students],
+            session_ids=session_ids[order],
+            subject_ids=np.array([s[1] for s in sessions], dtype=np.int64)[order],
+            dates=dates[order],
+            periods=periods[order],
+            present=present[:, order],
+            marked=marked[:, order]
+        )
+
+    @staticmethod
+    def _percentage(attended, total):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(total > 0, attended * 100.0 / total, 0.0)
+
+    @staticmethod
+    def student_percentages(matrix):
+        """Overall attendance percentage per student."""
+        return AttendanceAnalytics._percentage(
+            matrix.present.sum(axis=1), matrix.marked.sum(axis=1)
+        )
+
+    @staticmethod
+    def subject_counts(matrix):
+        """
+        Return (subject_ids, attended, total) where attended and total are
+        (student x subject) count matrices.
+        """
+        subject_ids, column_subject = np.unique(matrix.subject_ids, return_inverse=True)
+        one_hot = np.zeros((len(matrix.subject_ids), len(subject_ids)), dtype=np.int64)
+        one_hot[np.arange(len(matrix.subject_ids)), column_subject] = 1
+        attended = matrix.present.astype(np.int64) @ one_hot
+        total = matrix.marked.astype(np.int64) @ one_hot
+        return subject_ids, attended, total
+
+    @staticmethod
+    def subject_percentages(matrix):
+        """Return (subject_ids, student x subject percentage matrix)."""
+        subject_ids, attended, total = AttendanceAnalytics.subject_counts(matrix)
+        return subject_ids, AttendanceAnalytics._percentage(attended, total)
+
+    @staticmethod
+    def absence_heatmap(matrix):
+        """
+        Absence rate (%) by day of week and period, as a 7 x max_period
+        matrix; cells without any session are 0.
+        """
+        n_periods = int(matrix.periods.max()) if len(matrix.periods) else 0
+        absent = np.zeros((7, n_periods))
+        total = np.zeros((7, n_periods))
+        if n_periods:
+            cells = (matrix.weekdays, matrix.periods - 1)
+            np.add.at(absent, cells, matrix.absent.sum(axis=0))
+            np.add.at(total, cells, matrix.marked.sum(axis=0))
+        return AttendanceAnalytics._percentage(absent, total)
+
+    @staticmethod
+    def absence_streaks(matrix):
+        """
+        Return (longest, current) consecutive-absence streaks per student.
+        Sessions without a record for the student break a streak.
+        """
+        n_students, n_sessions = matrix.absent.shape
+        padded = np.zeros((n_students, n_sessions + 2), dtype=np.int8)
+        padded[:, 1:-1] = matrix.absent
+        edges = np.diff(padded, axis=1)
+        # Runs start at +1 edges and end at -1 edges, paired in row-major order
+        start_rows, start_cols = np.nonzero(edges == 1)
+        _, end_cols = np.nonzero(edges == -1)
+        lengths = end_cols - start_cols
+
+        longest = np.zeros(n_students, dtype=np.int64)
+        np.maximum.at(longest, start_rows, lengths)
+        current = np.zeros(n_students, dtype=np.int64)
+        ongoing = end_cols == n_sessions
+        current[start_rows[ongoing]] = lengths[ongoing]
+        return longest, current
+
+    @staticmethod
+    def classes_needed(attended, total, threshold=LOW_ATTENDANCE_THRESHOLD):
+        """
+        Consecutive classes a student must attend to reach `threshold` percent,
+        element-wise over count arrays: smallest x with
+        (attended + x) / (total + x) >= threshold / 100.
+        """
+        ratio = threshold / 100.0
+        needed = np.ceil((ratio * total - attended) / (1 - ratio) - 1e-9)
+        return np.maximum(needed, 0).astype(np.int64)
+
+    @staticmethod
+    def section_report(department_id, year, section):
+        """Compute every section-level report from a single matrix load."""
+        matrix = AttendanceAnalytics.load_matrix(department_id, year, section)
+        subject_ids, attended, total = AttendanceAnalytics.subject_counts(matrix)
+        subject_pct = AttendanceAnalytics._percentage(attended, total)
+        needed = AttendanceAnalytics.classes_needed(attended, total)
+        longest, current = AttendanceAnalytics.absence_streaks(matrix)
+        overall = AttendanceAnalytics.student_percentages(matrix)
+
+        subjects = {s.id: s for s in Subject.query.filter(Subject.id.in_(subject_ids.tolist()))}
+        subject_list = [subjects.get(int(sid)) for sid in subject_ids]
+
+        students = []
+        for i, student_id in enumerate(matrix.student_ids.tolist()):
+            students.append({
+                'id': student_id,
+                'roll_number': matrix.roll_numbers[i],
+                'name': matrix.names[i],
+                'percentage': float(overall[i]),
+                'longest_streak': int(longest[i]),
+                'current_streak': int(current[i]),
+                'subjects': [{
+                    'percentage': float(subject_pct[i, j]),
+                    'classes_needed': int(needed[i, j]),
+                    'total': int(total[i, j])
+                } for j in range(len(subject_ids))]
+            })
+        students.sort(key=lambda s: s['roll_number'])
+
+        subject_totals = total.sum(axis=0)
+        subject_average = AttendanceAnalytics._percentage(attended.sum(axis=0), subject_totals)
+
+        return {
+            'students': students,
+            'subjects': [{
+                'subject': subject,
+                'percentage': float(subject_average[j]),
+                'sessions': int((matrix.subject_ids == subject_ids[j]).sum())
+            } for j, subject in enumerate(subject_list)],
+            'heatmap': AttendanceAnalytics.absence_heatmap(matrix).tolist(),
+            'session_count': len(matrix.session_ids)
+        }
@@ -0,0 +1,151 @@
+from datetime import datetime
+from sqlalchemy import case, func, literal
+from sqlalchemy.orm import joinedload, selectinload
+from ..extensions import db
+from ..models import (
+    AttendanceSession, AttendanceRecord, AttendanceSummary, AttendanceAlert,
+    AttendanceSessionArchive, AttendanceRecordArchive, AttendanceSummarySnapshot
+)
+from .attendance_service import AttendanceService
+
+
+class AttendanceArchive:
+    @staticmethod
+    def archive_term(term, end_date):
+        """
+        Move every session dated on or before `end_date`, with its records,
+        into the archive tables under `term`, which must not be archived
+        yet, freezing per student-subject snapshots first. Archive rows get
+        their own ids and keep the hot ids in `original_id`. Live summaries are then rebuilt from the remaining
+        (current term) records, and only alerts that still apply are kept.
+        Runs as one transaction with set-based statements; the caller
+        commits. Returns (sessions, records) archived.
+        """
+        closed_sessions = db.select(AttendanceSession.id).where(
+            AttendanceSession.date <= end_date
+        )
+        now = datetime.utcnow()
+
+        attended = func.sum(case((AttendanceRecord.is_present == True, 1), else_=0))  # noqa: E712
+        total_classes = func.count(AttendanceRecord.id)
+        db.session.execute(
+            db.insert(AttendanceSummarySnapshot).from_select(
+                ['term', 'student_id', 'subject_id', 'total_classes', 'attended',
+                 'percentage', 'archived_at'],
+                db.select(
+                    literal(term),
+                    AttendanceRecord.student_id,
+                    AttendanceSession.subject_id,
+                    total_classes,
+                    attended,
+                    attended * 100.0 / total_classes,
+                    literal(now, db.DateTime)
+                ).join(AttendanceSession).where(
+                    AttendanceSession.date <= end_date
+                ).group_by(AttendanceRecord.student_id, AttendanceSession.subject_id)
+            )
+        )
+
+        sessions = db.session.execute(
+            db.insert(AttendanceSessionArchive).from_select(
+                ['original_id', 'term', 'subject_id', 'staff_id', 'date', 'period', 'year',
+                 'section', 'department_id', 'created_at'],
+                db.select(
+                    AttendanceSession.id,
+                    literal(term),
+                    AttendanceSession.subject_id,
+                    AttendanceSession.staff_id,
+                    AttendanceSession.date,
+                    AttendanceSession.period,
+                    AttendanceSession.year,
+                    AttendanceSession.section,
+                    AttendanceSession.department_id,
+                    AttendanceSession.created_at
+                ).where(AttendanceSession.date <= end_date)
+            )
+        ).rowcount
+
+        # Hot ids are reused once the tables are emptied, so records point at the new archive ids
+        records = db.session.execute(
+            db.insert(AttendanceRecordArchive).from_select(
+                ['original_id', 'session_id', 'student_id', 'is_present'],
+                db.select(
+                    AttendanceRecord.id,
+                    AttendanceSessionArchive.id,
+                    AttendanceRecord.student_id,
+                    AttendanceRecord.is_present
+                ).join(
+                    AttendanceSessionArchive,
+                    (AttendanceSessionArchive.original_id == AttendanceRecord.session_id)
+                    & (AttendanceSessionArchive.term == term)
+                )
+            )
+        ).rowcount
+
+        db.session.execute(
+            db.delete(AttendanceRecord).where(AttendanceRecord.session_id.in_(closed_sessions))
+        )
+        db.session.execute(
+            db.delete(AttendanceSession).where(AttendanceSession.date <= end_date)
+        )
+
+        # Live summaries restart from the current term's records
+        AttendanceService.rebuild_summaries()
+
+        # Keep alerts whose pair is still below the alerted band, so those students are not alerted again
+        still_low = db.session.query(AttendanceSummary.id).filter(
+            AttendanceSummary.student_id == AttendanceAlert.student_id,
+            AttendanceSummary.subject_id == AttendanceAlert.subject_id,
+            AttendanceSummary.percentage < AttendanceAlert.band
+        ).exists()
+        db.session.execute(
+            db.delete(AttendanceAlert).where(~still_low)
+            .execution_options(synchronize_session=False)
+        )
+        return sessions, records
+
+    @staticmethod
+    def term_exists(term):
+        return db.session.query(
+            AttendanceSessionArchive.query.filter_by(term=term).exists()
+        ).scalar()
+
+    @staticmethod
+    def student_snapshots(student_id):
+        """Frozen summaries of a student grouped by term, most recent first."""
+        snapshots = AttendanceSummarySnapshot.query.options(
+            joinedload(AttendanceSummarySnapshot.subject)
+        ).filter_by(student_id=student_id).order_by(
+            AttendanceSummarySnapshot.archived_at.desc()
+        ).all()
+
+        terms = {}
+        for snapshot in snapshots:
+            terms.setdefault(snapshot.term, []).append(snapshot)
+        return terms
+
+    @staticmethod
+    def staff_terms(staff_id):
+        """Archived terms that contain sessions of a staff member."""
+        return [term for (term,) in db.session.query(
+            AttendanceSessionArchive.term
+        ).filter_by(staff_id=staff_id).distinct().order_by(AttendanceSessionArchive.term.desc())]
+
+    @staticmethod
+    def staff_sessions(staff_id, term):
+        """Archived sessions of a staff member in a term with present/total counts."""
+        present = func.sum(case((AttendanceRecordArchive.is_present == True, 1), else_=0))  # noqa: E712
+        rows = db.session.query(
+            AttendanceSessionArchive,
+            func.count(AttendanceRecordArchive.id),
+            present
+        ).outerjoin(AttendanceRecordArchive).options(
+            selectinload(AttendanceSessionArchive.subject)
+        ).filter(
+            AttendanceSessionArchive.staff_id == staff_id,
+            AttendanceSessionArchive.term == term
+        ).group_by(AttendanceSessionArchive.id).order_by(
+            AttendanceSessionArchive.date.desc(), AttendanceSessionArchive.id.desc()
+        ).all()
+        return [{'session': session, 'total': total, 'present': present_count or 0}
+                for session, total, present_count in rows]
@@ -0,0 +1,409 @@
+from datetime import datetime
+from sqlalchemy import case, func, literal, true
+from sqlalchemy.orm import joinedload, selectinload
+from ..extensions import db
+from ..models import (
+    AttendanceSession, AttendanceRecord, AttendanceSummary, AttendanceAlert,
+    Student, Staff, Subject, Timetable, PeriodTiming
+)
+from ..models.user import staff_subjects
+from ..utils.db import upsert_insert
+from .notification_service import NotificationService
+
+
+LOW_ATTENDANCE_THRESHOLD = 75
+MIN_CLASSES_FOR_ALERT = 5
+# Alert bands, from mildest to most severe; each is alerted once per student-subject pair
+ALERT_BANDS = (75, 65, 50)
+# Keyset ordering of a staff member's session listing
+SESSION_KEYSET = (AttendanceSession.date, AttendanceSession.id)
+
+
+class StaleSessionError(Exception):
+    """Raised when attendance changes are based on an outdated session version."""
+
+
+class AttendanceService:
+    # Query builders shared by the routes, the services and the index audit
+
+    @staticmethod
+    def class_students_query(department_id, year, section):
+        """Students of a class in roll number order."""
+        return Student.query.filter_by(
+            department_id=department_id,
+            year=year,
+            section=section
+        ).order_by(Student.roll_number)
+
+    @staticmethod
+    def session_records_query(session_id):
+        """(student_id, is_present) of every record of a session."""
+        return db.session.query(
+            AttendanceRecord.student_id, AttendanceRecord.is_present
+        ).filter(AttendanceRecord.session_id == session_id)
+
+    @staticmethod
+    def staff_sessions_query(staff_id):
+        """(session, records, present) rows of a staff member's sessions, unordered."""
+        present = func.sum(case((AttendanceRecord.is_present == True, 1), else_=0))  # noqa: E712
+        return db.session.query(
+            AttendanceSession,
+            func.count(AttendanceRecord.id),
+            present
+        ).outerjoin(AttendanceRecord).options(
+            selectinload(AttendanceSession.subject)
+        ).filter(
+            AttendanceSession.staff_id == staff_id
+        ).group_by(AttendanceSession.id)
+
+    @staticmethod
+    def day_sessions_query(staff_id, day):
+        """(session, records marked) rows of a staff member's sessions on a day, by period."""
+        return db.session.query(
+            AttendanceSession,
+            func.count(AttendanceRecord.id)
+        ).outerjoin(AttendanceRecord).options(
+            selectinload(AttendanceSession.subject)
+        ).filter(
+            AttendanceSession.staff_id == staff_id,
+            AttendanceSession.date == day
+        ).group_by(AttendanceSession.id).order_by(AttendanceSession.period)
+
+    @staticmethod
+    def student_summaries_query(student_id):
+        """Attendance summaries of a student with their subjects."""
+        return AttendanceSummary.query.options(
+            joinedload(AttendanceSummary.subject)
+        ).filter_by(student_id=student_id)
+
+    @staticmethod
+    def recent_records_query(student_id, per_subject):
+        """The last `per_subject` records of a student in each subject, from one windowed query."""
+        row_number = func.row_number().over(
+            partition_by=AttendanceSession.subject_id,
+            order_by=(AttendanceSession.date.desc(), AttendanceSession.period.desc())
+        ).label('row_number')
+        ranked = db.session.query(
+            AttendanceSession.subject_id,
+            AttendanceSession.date,
+            AttendanceSession.period,
+            AttendanceRecord.is_present,
+            row_number
+        ).join(AttendanceRecord).filter(
+            AttendanceRecord.student_id == student_id
+        ).subquery()
+        return db.session.query(ranked).filter(
+            ranked.c.row_number <= per_subject
+        ).order_by(ranked.c.subject_id, ranked.c.row_number)
+
+    @staticmethod
+    def low_attendance_query(subject_id=None, student_ids=None):
+        """
+        Below-threshold student-subject pairs not yet alerted for their
+        current band, with the student and subject details of the alert.
+        """
+        band = case(
+            *[(AttendanceSummary.percentage < threshold, threshold)
+              for threshold in sorted(ALERT_BANDS)]
+        )
+        # Only alert when the pair has dropped into a band not yet alerted
+        already_alerted = db.session.query(AttendanceAlert.id).filter(
+            AttendanceAlert.student_id == AttendanceSummary.student_id,
+            AttendanceAlert.subject_id == AttendanceSummary.subject_id,
+            AttendanceAlert.band <= band
+        ).exists()
+        query = db.session.query(
+            AttendanceSummary.student_id,
+            AttendanceSummary.subject_id,
+            AttendanceSummary.percentage,
+            band,
+            Student.user_id,
+            Student.name,
+            Student.roll_number,
+            Subject.name
+        ).join(
+            Student, Student.id == AttendanceSummary.student_id
+        ).join(
+            Subject, Subject.id == AttendanceSummary.subject_id
+        ).filter(
+            AttendanceSummary.percentage < LOW_ATTENDANCE_THRESHOLD,
+            AttendanceSummary.total_classes >= MIN_CLASSES_FOR_ALERT,
+            ~already_alerted
+        )
+        if subject_id is not None:
+            query = query.filter(AttendanceSummary.subject_id == subject_id)
+        if student_ids is not None:
+            query = query.filter(AttendanceSummary.student_id.in_(student_ids))
+        return query
+
+    @staticmethod
+    def scheduled_slots(day):
+        """SELECT of the session columns for every active teaching slot on `day`."""
+        return db.select(
+            Timetable.subject_id,
+            Timetable.staff_id,
+            literal(day, db.Date),
+            Timetable.period,
+            Timetable.year,
+            Timetable.section,
+            Timetable.department_id,
+            literal(datetime.utcnow(), db.DateTime)
+        ).outerjoin(
+            PeriodTiming, PeriodTiming.period == Timetable.period
+        ).where(
+            Timetable.day_of_week == day.weekday(),
+            Timetable.is_active == True,  # noqa: E712
+            # Periods without a timing row, or with is_break unset, are teaching periods
+            PeriodTiming.is_break.isnot(True)
+        )
+
+    @staticmethod
+    def create_scheduled_sessions(day):
+        """
+        Create the attendance sessions for every active timetable slot on `day`
+        with a single INSERT ... SELECT. Slots that already have a session are
+        skipped through the unique_session constraint, so this is idempotent.
+        Returns the number of sessions created. The caller commits.
+        """
+        stmt = upsert_insert(AttendanceSession).from_select(
+            ['subject_id', 'staff_id', 'date', 'period', 'year', 'section',
+             'department_id', 'created_at'],
+            AttendanceService.scheduled_slots(day)
+        ).on_conflict_do_nothing(
+            index_elements=['subject_id', 'date', 'period', 'section', 'department_id']
+        )
+        return db.session.execute(stmt).rowcount
+
+    @staticmethod
+    def mark_session(session, students, present_ids):
+        """Save attendance for all students of a session from a full form submission."""
+        present_ids = {int(sid) for sid in present_ids}
+        changes = {student.id: student.id in present_ids for student in students}
+        return AttendanceService.apply_changes(session, changes)
+
+    @staticmethod
+    def apply_changes(session, changes, expected_version=None):
+        """
+        Save attendance changes for a session; `changes` maps student_id to
+        is_present. The session version is bumped first, and when
+        `expected_version` is given a mismatch raises StaleSessionError.
+        Existing records are loaded in one query and only new or changed
+        rows are written, as a single INSERT ... ON CONFLICT executemany.
+        The first write of a session also records every other student of
+        the class as absent, so untouched students still count the class.
+        Summaries are then adjusted by the delta of each changed record.
+        Returns the ids of the students whose records were written.
+        """
+        query = AttendanceSession.query.filter_by(id=session.id)
+        if expected_version is not None:
+            query = query.filter_by(version=expected_version)
+        if not query.update({'version': AttendanceSession.version + 1},
+                            synchronize_session=False):
+            raise StaleSessionError(session.id)
+
+        existing = dict(AttendanceService.session_records_query(session.id).all())
+        if not existing:
+            # Checkboxes start unchecked, so students left alone are absent
+            class_ids = AttendanceService.class_students_query(
+                session.department_id, session.year, session.section
+            ).with_entities(Student.id)
+            changes = {**{student_id: False for (student_id,) in class_ids}, **changes}
+
+        rows = []
+        deltas = {}
+        for student_id, is_present in changes.items():
+            previous = existing.get(student_id)
+            if previous == is_present:
+                continue
+
+            rows.append({
+                'session_id': session.id,
+                'student_id': student_id,
+                'is_present': is_present
+            })
+            if previous is None:
+                # New record: one more class, attended if present
+                deltas[student_id] = (1, 1 if is_present else 0)
+            else:
+                # Flip between present and absent
+                deltas[student_id] = (0, 1 if is_present else -1)
+
+        if not rows:
+            return []
+
+        stmt = upsert_insert(AttendanceRecord)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['session_id', 'student_id'],
+            set_={'is_present': stmt.excluded.is_present}
+        )
+        db.session.execute(stmt, rows)
+
+        AttendanceService.apply_summary_deltas(session.subject_id, deltas)
+        return list(deltas)
+
+    @staticmethod
+    def session_counts(session_id):
+        """Return (present, total) record counts for a session."""
+        present, total = db.session.query(
+            func.sum(case((AttendanceRecord.is_present == True, 1), else_=0)),  # noqa: E712
+            func.count(AttendanceRecord.id)
+        ).filter(AttendanceRecord.session_id == session_id).one()
+        return present or 0, total
+
+    @staticmethod
+    def apply_summary_deltas(subject_id, deltas):
+        """
+        Add (total_classes, attended) deltas to the summaries of a subject.
+        deltas maps student_id -> (total_delta, attended_delta); the work is
+        O(1) per student regardless of how many records already exist.
+        """
+        if not deltas:
+            return
+
+        now = datetime.utcnow()
+        rows = [{
+            'student_id': student_id,
+            'subject_id': subject_id,
+            'total_classes': total_delta,
+            'attended': attended_delta,
+            'percentage': (attended_delta / total_delta * 100) if total_delta > 0 else 0.0,
+            'last_updated': now
+        } for student_id, (total_delta, attended_delta) in deltas.items()]
+
+        summary = AttendanceSummary.__table__
+        stmt = upsert_insert(AttendanceSummary)
+        total_classes = summary.c.total_classes + stmt.excluded.total_classes
+        attended = summary.c.attended + stmt.excluded.attended
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['student_id', 'subject_id'],
+            set_={
+                'total_classes': total_classes,
+                'attended': attended,
+                'percentage': case(
+                    (total_classes > 0, attended * 100.0 / total_classes),
+                    else_=0.0
+                ),
+                'last_updated': stmt.excluded.last_updated
+            }
+        )
+        db.session.execute(stmt, rows)
+
+    @staticmethod
+    def rebuild_summaries():
+        """
+        Reconcile every AttendanceSummary with the attendance records using a
+        single INSERT ... SELECT ... GROUP BY upsert, then delete summaries
+        whose records are gone. Returns the number of student-subject pairs
+        rebuilt. The caller commits.
+        """
+        attended = func.sum(case((AttendanceRecord.is_present == True, 1), else_=0))  # noqa: E712
+        total_classes = func.count(AttendanceRecord.id)
+        aggregate = db.select(
+            AttendanceRecord.student_id,
+            AttendanceSession.subject_id,
+            total_classes,
+            attended,
+            attended * 100.0 / total_classes,
+            literal(datetime.utcnow())
+        ).join(AttendanceSession).where(true()).group_by(
+            AttendanceRecord.student_id, AttendanceSession.subject_id
+        )
+
+        stmt = upsert_insert(AttendanceSummary).from_select(
+            ['student_id', 'subject_id', 'total_classes', 'attended',
+             'percentage', 'last_updated'],
+            aggregate
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['student_id', 'subject_id'],
+            set_={
+                'total_classes': stmt.excluded.total_classes,
+                'attended': stmt.excluded.attended,
+                'percentage': stmt.excluded.percentage,
+                'last_updated': stmt.excluded.last_updated
+            }
+        )
+        rebuilt = db.session.execute(stmt).rowcount
+
+        has_records = db.session.query(AttendanceRecord.id).join(AttendanceSession).filter(
+            AttendanceRecord.student_id == AttendanceSummary.student_id,
+            AttendanceSession.subject_id == AttendanceSummary.subject_id
+        ).exists()
+        db.session.execute(
+            db.delete(AttendanceSummary).where(~has_records)
+            .execution_options(synchronize_session=False)
+        )
+        return rebuilt
+
+    @staticmethod
+    def evaluate_low_attendance(subject_id=None, student_ids=None):
+        """
+        Alert students and their subject staff about low attendance.
+        Every below-threshold pair is found in one query; a pair is alerted
+        again only when it drops into a more severe band, until it recovers
+        above the threshold. Alerts and notifications are written in bulk. The caller commits.
+        Returns the number of new alerts.
+        """
+        # Forget alerts once a student is back above the threshold
+        recovered = db.session.query(AttendanceSummary.id).filter(
+            AttendanceSummary.student_id == AttendanceAlert.student_id,
+            AttendanceSummary.subject_id == AttendanceAlert.subject_id,
+            AttendanceSummary.percentage >= LOW_ATTENDANCE_THRESHOLD
+        ).exists()
+        stale = db.session.query(AttendanceAlert).filter(recovered)
+        if subject_id is not None:
+            stale = stale.filter(AttendanceAlert.subject_id == subject_id)
+        if student_ids is not None:
+            stale = stale.filter(AttendanceAlert.student_id.in_(student_ids))
+        stale.delete(synchronize_session=False)
+
+        pending = AttendanceService.low_attendance_query(subject_id, student_ids).all()
+        if not pending:
+            return 0
+
+        # Staff teaching each affected subject, in one query
+        staff_by_subject = {}
+        for subj_id, user_id in db.session.query(
+            staff_subjects.c.subject_id, Staff.user_id
+        ).join(Staff, Staff.id == staff_subjects.c.staff_id).filter(
+            staff_subjects.c.subject_id.in_({row[1] for row in pending})
+        ):
+            staff_by_subject.setdefault(subj_id, []).append(user_id)
+
+        now = datetime.utcnow()
+        alerts = []
+        notifications = []
+        for (student_id, subj_id, percentage, alert_band,
+             user_id, student_name, roll_number, subject_name) in pending:
+            alerts.append({
+                'student_id': student_id,
+                'subject_id': subj_id,
+                'band': alert_band,
+                'percentage': percentage,
+                'created_at': now
+            })
+            notifications.append({
+                'user_id': user_id,
+                'notification_type': 'low_attendance',
+                'title': 'Low Attendance Warning',
+                'message': f'Your attendance in {subject_name} is {percentage:.1f}%, '
+                           f'which is below the required {LOW_ATTENDANCE_THRESHOLD}%.',
+                'reference_type': 'attendance',
+                'reference_id': subj_id,
+                'created_at': now
+            })
+            for staff_user_id in staff_by_subject.get(subj_id, []):
+                notifications.append({
+                    'user_id': staff_user_id,
+                    'notification_type': 'low_attendance',
+                    'title': 'Student Low Attendance Alert',
+                    'message': f'{student_name} (Roll: {roll_number}) has {percentage:.1f}% '
+                               f'attendance in {subject_name}.',
+                    'reference_type': 'attendance',
+                    'reference_id': subj_id,
+                    'created_at': now
+                })
+
+        db.session.execute(db.insert(AttendanceAlert), alerts)
+        NotificationService.create_notifications(notifications)
+        return len(alerts)
@@ -0,0 +1,244 @@
+import csv
+import io
+import re
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import bindparam, func
+from ..extensions import db
+from ..models import Student, StudentFees, FeeStructure, FeePayment
+from .fee_service import AMOUNT_EPSILON, _status
+
+
+RECONCILE_BATCH_SIZE = 1000
+MAX_REPORTED_UNMATCHED = 500
+
+TRANSACTION_COLUMNS = ('transaction_id', 'transaction id', 'txn id', 'reference', 'ref no', 'utr')
+AMOUNT_COLUMNS = ('amount', 'credit', 'deposit', 'credit amount')
+ROLL_COLUMNS = ('roll_number', 'roll number', 'roll no', 'roll')
+NARRATION_COLUMNS = ('narration', 'description', 'particulars', 'remarks')
+
+TOKEN_PATTERN = re.compile(r'[A-Za-z0-9]+')
+AMOUNT_PATTERN = re.compile(r'-?\d[\d,]*(?:\.\d+)?')  # Ignores currency symbols and CR suffixes
+
+
+class FeeReconciliationError(Exception):
+    """Raised when a bank statement file cannot be read at all."""
+
+
+def _cents(amount):
+    return int(round(amount * 100))
+
+
+class FeeReconciliation:
+    @staticmethod
+    def iter_rows(stream):
+        """Stream rows of a bank statement CSV from a binary stream."""
+        try:
+            yield from csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+        except (UnicodeDecodeError, csv.Error):
+            raise FeeReconciliationError('The statement is not a valid UTF-8 CSV file.')
+
+    @staticmethod
+    def _cell(row, index):
+        if index is None or index >= len(row):
+            return ''
+        return str(row[index] or '').strip()
+
+    @staticmethod
+    def _find_column(header, names):
+        for index, cell in enumerate(header):
+            if str(cell or '').strip().lower() in names:
+                return index
+        return None
+
+    @staticmethod
+    def load_indexes():
+        """
+        Preload every open fee with one column-only query and index it by
+        roll number, fee reference and outstanding balance, together with
+        the transaction ids already in the ledger.
+        """
+        rows = db.session.query(
+            StudentFees.id, Student.roll_number, StudentFees.transaction_id,
+            StudentFees.amount_due - func.coalesce(StudentFees.amount_paid, 0)
+        ).join(
+            Student, Student.id == StudentFees.student_id
+        ).join(
+            FeeStructure, FeeStructure.id == StudentFees.fee_structure_id
+        ).filter(
+            StudentFees.amount_due - func.coalesce(StudentFees.amount_paid, 0) > AMOUNT_EPSILON
+        ).order_by(FeeStructure.due_date, StudentFees.id)
+
+        balances = {}
+        by_roll = defaultdict(list)  # Oldest due first
+        by_reference = {}
+        by_amount = defaultdict(list)
+        for fee_id, roll_number, reference, balance in rows:
+            balances[fee_id] = balance
+            by_roll[roll_number.upper()].append(fee_id)
+            if reference:
+                by_reference[reference] = fee_id
+            by_amount[_cents(balance)].append(fee_id)
+
+        recorded = {reference for (reference,) in db.session.query(
+            FeePayment.transaction_id
+        ).filter(FeePayment.transaction_id.isnot(None)).distinct()}
+
+        return {
+            'balances': balances,
+            'by_roll': by_roll,
+            'by_reference': by_reference,
+            'by_amount': by_amount,
+            'recorded': recorded
+        }
+
+    @staticmethod
+    def _match(indexes, reference, roll_number, narration, amount):
+        """Return (fee_id, method) or (None, reason) for one statement line."""
+        balances = indexes['balances']
+
+        fee_id = indexes['by_reference'].get(reference) if reference else None
+        if fee_id is not None and balances[fee_id] > AMOUNT_EPSILON:
+            return fee_id, 'transaction_id'
+
+        rolls = [roll_number.upper()] if roll_number else [
+            token.upper() for token in TOKEN_PATTERN.findall(narration)
+        ]
+        for roll in rolls:
+            fee_ids = [f for f in indexes['by_roll'].get(roll, ()) if balances[f] > AMOUNT_EPSILON]
+            if not fee_ids:
+                continue
+            # Prefer the fee this amount settles exactly, then the oldest one it fits
+            for candidates in ([f for f in fee_ids if abs(balances[f] - amount) <= AMOUNT_EPSILON],
+                               [f for f in fee_ids if balances[f] + AMOUNT_EPSILON >= amount]):
+                if candidates:
+                    return candidates[0], 'roll_number'
+            return None, 'Amount exceeds the outstanding balance of the student.'
+        if roll_number:
+            return None, f'No outstanding fee for roll number "{roll_number}".'
+
+        # Last resort: the only open fee whose balance is exactly this amount
+        fee_ids = [f for f in indexes['by_amount'].get(_cents(amount), ())
+                   if abs(balances[f] - amount) <= AMOUNT_EPSILON]
+        if len(fee_ids) == 1:
+            return fee_ids[0], 'amount'
+        if fee_ids:
+            return None, f'{len(fee_ids)} outstanding fees have this amount.'
+        return None, 'No matching student or fee.'
+
+    @staticmethod
+    def _apply(entries, recorded_by):
+        """
+        Post one batch of matched payments: one executemany insert into the
+        ledger and one executemany relative UPDATE of the cached balances.
+        """
+        now = datetime.utcnow()
+        db.session.execute(db.insert(FeePayment), [{
+            'student_fee_id': fee_id,
+            'entry_type': 'payment',
+            'amount': amount,
+            'transaction_id': reference,
+            'remarks': 'Bank statement reconciliation',
+            'recorded_by': recorded_by,
+            'created_at': now
+        } for fee_id, amount, reference in entries])
+
+        totals = defaultdict(float)
+        for fee_id, amount, _ in entries:
+            totals[fee_id] += amount
+
+        fees = StudentFees.__table__
+        amount_paid = func.coalesce(fees.c.amount_paid, 0) + bindparam('paid')
+        db.session.execute(
+            fees.update().where(fees.c.id == bindparam('fee_id')).values(
+                amount_paid=amount_paid,
+                payment_status=_status(amount_paid, fees.c.amount_due),
+                payment_date=now,
+                updated_at=now
+            ),
+            [{'fee_id': fee_id, 'paid': paid} for fee_id, paid in totals.items()]
+        )
+
+    @staticmethod
+    def reconcile_statement(rows, recorded_by=None, max_unmatched=MAX_REPORTED_UNMATCHED):
+        """
+        Match bank statement lines to open fees and post them as ledger
+        payments. Lines are matched in memory against preloaded indexes,
+        by fee transaction id, then by roll number (column or narration),
+        then by a unique outstanding amount, and written in batches of
+        RECONCILE_BATCH_SIZE. Transaction ids already in the ledger are
+        skipped, so a statement can be imported twice. The caller commits.
+        Returns a report dict with match counts and the first max_unmatched
+        unmatched lines (all of them when None).
+        """
+        rows = iter(rows)
+        header = next(rows, None)
+        if header is None:
+            raise FeeReconciliationError('The statement file is empty.')
+        amount_col = FeeReconciliation._find_column(header, AMOUNT_COLUMNS)
+        reference_col = FeeReconciliation._find_column(header, TRANSACTION_COLUMNS)
+        roll_col = FeeReconciliation._find_column(header, ROLL_COLUMNS)
+        narration_col = FeeReconciliation._find_column(header, NARRATION_COLUMNS)
+        if amount_col is None or reference_col is None:
+            raise FeeReconciliationError(
+                'The first row must contain "transaction_id" and "amount" columns.')
+
+        indexes = FeeReconciliation.load_indexes()
+        balances = indexes['balances']
+        report = {
+            'lines': 0, 'matched': 0, 'amount': 0.0,
+            'methods': defaultdict(int), 'unmatched': [], 'unmatched_count': 0
+        }
+        seen = set()
+        batch = []
+
+        def unmatched(row_number, reference, roll_number, amount, reason):
+            report['unmatched_count'] += 1
+            if max_unmatched is None or len(report['unmatched']) < max_unmatched:
+                report['unmatched'].append((row_number, reference, roll_number, amount, reason))
+
+        cell = FeeReconciliation._cell
+        for row_number, row in enumerate(rows, start=2):
+            raw_amount = cell(row, amount_col)
+            if raw_amount == '':
+                # Debit lines have no credit amount
+                continue
+            report['lines'] += 1
+            reference = cell(row, reference_col)
+            roll_number = cell(row, roll_col)
+
+            number = AMOUNT_PATTERN.search(raw_amount)
+            if number is None:
+                unmatched(row_number, reference, roll_number, raw_amount, f'Invalid amount "{raw_amount}".')
+                continue
+            amount = float(number.group().replace(',', ''))
+            if amount <= 0:
+                unmatched(row_number, reference, roll_number, amount, 'Not a credit.')
+                continue
+            if not reference:
+                unmatched(row_number, reference, roll_number, amount, 'Missing transaction id.')
+                continue
+            if reference in indexes['recorded'] or reference in seen:
+                unmatched(row_number, reference, roll_number, amount, 'Transaction already recorded.')
+                continue
+
+            fee_id, result = FeeReconciliation._match(
+                indexes, reference, roll_number, cell(row, narration_col), amount)
+            if fee_id is None:
+                unmatched(row_number, reference, roll_number, amount, result)
+                continue
+
+            seen.add(reference)
+            balances[fee_id] -= amount
+            batch.append((fee_id, amount, reference))
+            report['matched'] += 1
+            report['amount'] += amount
+            report['methods'][result] += 1
+            if len(batch) >= RECONCILE_BATCH_SIZE:
+                FeeReconciliation._apply(batch, recorded_by)
+                batch.clear()
+
+        if batch:
+            FeeReconciliation._apply(batch, recorded_by)
+        report['methods'] = dict(report['methods'])
+        return report
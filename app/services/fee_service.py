@@ -0,0 +1,340 @@
+from datetime import date, datetime, timedelta
+import time
+from sqlalchemy import and_, case, func, literal, true
+from sqlalchemy.orm import contains_eager
+from ..extensions import db
+from ..models import Student, StudentFees, FeeStructure, FeePayment, Department
+from ..utils.db import upsert_insert
+
+
+# Tolerance when comparing cached and ledger amounts
+AMOUNT_EPSILON = 0.005
+
+PENDING_STATUSES = ('pending', 'partial')
+# Aging buckets of unpaid fees: (key, label, min days past due, max days past due)
+AGING_BUCKETS = (
+    ('not_due', 'Not Due', None, -1),
+    ('days_0_30', '0-30 Days', 0, 30),
+    ('days_31_60', '31-60 Days', 31, 60),
+    ('days_60_plus', '60+ Days', 61, None),
+)
+
+
+FEE_BALANCE = StudentFees.amount_due - func.coalesce(StudentFees.amount_paid, 0)
+# sort -> (keyset columns, descending, parser of the `after` cursor, cursor value of a fee)
+FEE_SORTS = {
+    'newest': ((StudentFees.created_at, StudentFees.id), True, datetime.fromisoformat,
+               lambda fee: fee.created_at),
+    'roll_number': ((Student.roll_number, StudentFees.id), False, str,
+                    lambda fee: fee.student.roll_number),
+    'name': ((Student.name, StudentFees.id), False, str,
+             lambda fee: fee.student.name),
+    'balance': ((FEE_BALANCE, StudentFees.id), True, float,
+                lambda fee: fee.amount_due - (fee.amount_paid or 0)),
+}
+
+
+def _status(amount_paid, amount_due):
+    return case(
+        (amount_paid >= amount_due, 'paid'),
+        (amount_paid > 0, 'partial'),
+        else_='pending'
+    )
+
+
+class FeeLedgerError(Exception):
+    """Raised when a ledger entry cannot be applied to a fee."""
+
+
+class FeeService:
+    @staticmethod
+    def _eligible_filters(fee_structure):
+        filters = []
+        if fee_structure.year:
+            filters.append(Student.year == fee_structure.year)
+        if fee_structure.department_id:
+            filters.append(Student.department_id == fee_structure.department_id)
+        return filters
+
+    @staticmethod
+    def assign_fee_structure(fee_structure):
+        """
+        Assign a fee structure to every matching student with a single
+        INSERT ... SELECT FROM students ... ON CONFLICT DO NOTHING; students
+        who already have it are skipped by unique_student_fee. The caller
+        commits. Returns a dict with eligible, assigned and skipped counts
+        and the time taken in seconds.
+        """
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        filters = FeeService._eligible_filters(fee_structure)
+
+        students = db.select(
+            Student.id,
+            literal(fee_structure.id),
+            literal(fee_structure.amount, db.Float),
+            literal(0.0, db.Float),
+            literal('pending'),
+            literal(now, db.DateTime),
+            literal(now, db.DateTime)
+        ).where(true(), *filters)
+
+        stmt = upsert_insert(StudentFees).from_select(
+            ['student_id', 'fee_structure_id', 'amount_due', 'amount_paid',
+             'payment_status', 'created_at', 'updated_at'],
+            students
+        ).on_conflict_do_nothing(index_elements=['student_id', 'fee_structure_id'])
+        assigned = db.session.execute(stmt).rowcount
+
+        eligible = db.session.query(func.count(Student.id)).filter(*filters).scalar()
+        return {
+            'eligible': eligible,
+            'assigned': assigned,
+            'skipped': eligible - assigned,
+            'seconds': time.perf_counter() - started
+        }
+
+    @staticmethod
+    def assign_to_students(fee_structure, student_ids, amount):
+        """Assign a fee to the given students with one executemany insert. The caller commits."""
+        now = datetime.utcnow()
+        rows = [{
+            'student_id': student_id,
+            'fee_structure_id': fee_structure.id,
+            'amount_due': amount,
+            'amount_paid': 0.0,
+            'payment_status': 'pending',
+            'created_at': now,
+            'updated_at': now
+        } for student_id in set(student_ids)]
+        if rows:
+            db.session.execute(db.insert(StudentFees), rows)
+        return len(rows)
+
+    @staticmethod
+    def record_entry(student_fee_id, amount, entry_type='payment', transaction_id=None,
+                     remarks=None, recorded_by=None):
+        """
+        Append a ledger entry and apply it to the cached balance of the fee
+        in the same transaction. The cached columns are updated with a
+        relative UPDATE (amount_paid = amount_paid + :amount), so concurrent
+        postings never overwrite each other. Refunds are given as positive
+        amounts and stored negated; FeeLedgerError is raised when a refund
+        exceeds the amount paid, and ValueError when the fee does not exist.
+        The caller commits.
+        """
+        signed = -abs(amount) if entry_type == 'refund' else amount
+        now = datetime.utcnow()
+
+        # The guard keeps concurrent refunds from taking the paid amount below zero
+        amount_paid = func.coalesce(StudentFees.amount_paid, 0) + signed
+        applied = db.session.execute(
+            db.update(StudentFees).where(
+                StudentFees.id == student_fee_id,
+                amount_paid >= -AMOUNT_EPSILON
+            ).values(
+                amount_paid=amount_paid,
+                payment_status=_status(amount_paid, StudentFees.amount_due),
+                payment_date=now,
+                updated_at=now
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        if not applied:
+            if db.session.get(StudentFees, student_fee_id) is None:
+                raise ValueError(f'Fee {student_fee_id} no longer exists.')
+            raise FeeLedgerError('The refund is larger than the amount paid.')
+
+        payment = FeePayment(
+            student_fee_id=student_fee_id,
+            entry_type=entry_type,
+            amount=signed,
+            transaction_id=transaction_id,
+            remarks=remarks,
+            recorded_by=recorded_by,
+            created_at=now
+        )
+        db.session.add(payment)
+        return payment
+
+    @staticmethod
+    def settle(student_fee, transaction_id=None, recorded_by=None):
+        """Post a payment for the outstanding balance, if any. The caller commits."""
+        db.session.refresh(student_fee)
+        if student_fee.balance <= AMOUNT_EPSILON:
+            return None
+        return FeeService.record_entry(student_fee.id, student_fee.balance, 'payment',
+                                       transaction_id=transaction_id,
+                                       remarks='Marked as fully paid', recorded_by=recorded_by)
+
+    @staticmethod
+    def set_amount_due(student_fee_id, amount_due):
+        """Change the amount due and recompute the cached status. The caller commits."""
+        db.session.execute(
+            db.update(StudentFees).where(StudentFees.id == student_fee_id).values(
+                amount_due=amount_due,
+                payment_status=_status(StudentFees.amount_paid, amount_due),
+                updated_at=datetime.utcnow()
+            ).execution_options(synchronize_session=False)
+        )
+
+    @staticmethod
+    def backfill_ledger():
+        """
+        Post an 'opening' entry for every fee that has a paid amount but no
+        ledger entries yet (amounts recorded before the ledger existed).
+        Returns the number of entries posted. The caller commits.
+        """
+        has_entries = db.session.query(FeePayment.id).filter(
+            FeePayment.student_fee_id == StudentFees.id
+        ).exists()
+        opening = db.select(
+            StudentFees.id,
+            literal('opening'),
+            StudentFees.amount_paid,
+            literal('Balance before the payment ledger'),
+            func.coalesce(StudentFees.payment_date, literal(datetime.utcnow(), db.DateTime))
+        ).where(StudentFees.amount_paid != 0, ~has_entries)
+        return db.session.execute(
+            db.insert(FeePayment).from_select(
+                ['student_fee_id', 'entry_type', 'amount', 'remarks', 'created_at'], opening
+            )
+        ).rowcount
+
+    @staticmethod
+    def reconcile_balances():
+        """
+        Recompute cached amount_paid and payment_status from the ledger with
+        one GROUP BY, updating only the fees that drifted. Returns the number
+        of fees corrected. The caller commits.
+        """
+        totals = db.select(
+            FeePayment.student_fee_id,
+            func.sum(FeePayment.amount).label('paid')
+        ).group_by(FeePayment.student_fee_id).subquery()
+
+        corrected = db.session.execute(
+            db.update(StudentFees).where(
+                StudentFees.id == totals.c.student_fee_id,
+                db.or_(
+                    func.abs(func.coalesce(StudentFees.amount_paid, 0) - totals.c.paid) > AMOUNT_EPSILON,
+                    func.coalesce(StudentFees.payment_status, '') != _status(totals.c.paid, StudentFees.amount_due)
+                )
+            ).values(
+                amount_paid=totals.c.paid,
+                payment_status=_status(totals.c.paid, StudentFees.amount_due)
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+
+        # Fees without any ledger entries have paid nothing
+        no_entries = ~db.session.query(FeePayment.id).filter(
+            FeePayment.student_fee_id == StudentFees.id
+        ).exists()
+        unpaid_status = _status(literal(0.0), StudentFees.amount_due)
+        corrected += db.session.execute(
+            db.update(StudentFees).where(
+                no_entries,
+                db.or_(func.coalesce(StudentFees.amount_paid, 1) != 0,
+                       func.coalesce(StudentFees.payment_status, '') != unpaid_status)
+            ).values(
+                amount_paid=0.0,
+                payment_status=unpaid_status
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        return corrected
+
+    @staticmethod
+    def aging_filter(bucket, today=None):
+        """WHERE clause selecting fees whose due date falls in an aging bucket."""
+        today = today or date.today()
+        for key, _, min_days, max_days in AGING_BUCKETS:
+            if key == bucket:
+                clauses = []
+                if min_days is not None:
+                    clauses.append(FeeStructure.due_date <= today - timedelta(days=min_days))
+                if max_days is not None:
+                    clauses.append(FeeStructure.due_date >= today - timedelta(days=max_days))
+                return and_(*clauses)
+        raise ValueError(f'Unknown aging bucket "{bucket}"')
+
+    @staticmethod
+    def fee_list_filters(department_id=None, status=None, search=''):
+        """WHERE clauses of the student fee listing; the query must join Student."""
+        filters = []
+        if department_id:
+            filters.append(Student.department_id == department_id)
+        if status:
+            filters.append(StudentFees.payment_status == status)
+        if search:
+            filters.append(db.or_(
+                Student.roll_number.istartswith(search, autoescape=True),
+                Student.name.icontains(search, autoescape=True)
+            ))
+        return filters
+
+    @staticmethod
+    def student_fees_query(filters=()):
+        """Student fees with their students, departments and fee structures, unordered."""
+        return StudentFees.query.join(
+            StudentFees.student
+        ).join(
+            StudentFees.fee_structure
+        ).options(
+            contains_eager(StudentFees.student).joinedload(Student.department),
+            contains_eager(StudentFees.fee_structure)
+        ).filter(*filters)
+
+    @staticmethod
+    def student_fees_totals(filters=()):
+        """Count, amount due, amount paid and balance over every fee matching `filters`."""
+        return db.session.query(
+            func.count(StudentFees.id).label('count'),
+            func.coalesce(func.sum(StudentFees.amount_due), 0).label('amount_due'),
+            func.coalesce(func.sum(StudentFees.amount_paid), 0).label('amount_paid'),
+            func.coalesce(func.sum(FEE_BALANCE), 0).label('balance')
+        ).select_from(StudentFees).join(
+            Student, Student.id == StudentFees.student_id
+        ).filter(*filters).one()
+
+    @staticmethod
+    def pending_fees_query(department_id=None, bucket=None):
+        """Unpaid fees, oldest due date first, optionally of a department and aging bucket."""
+        query = FeeService.student_fees_query([StudentFees.payment_status.in_(PENDING_STATUSES)])
+        if department_id:
+            query = query.filter(Student.department_id == department_id)
+        if bucket:
+            query = query.filter(FeeService.aging_filter(bucket))
+        return query.order_by(FeeStructure.due_date, StudentFees.id)
+
+    @staticmethod
+    def pending_summary(today=None):
+        """
+        Outstanding fees per department with aging buckets, in one GROUP BY
+        query. Returns (departments, totals), where each department dict has
+        id, name, fees, students, balance and one balance per bucket key.
+        """
+        balance = FEE_BALANCE
+        buckets = [
+            func.sum(case((FeeService.aging_filter(key, today), balance), else_=0)).label(key)
+            for key, _, _, _ in AGING_BUCKETS
+        ]
+        rows = db.session.query(
+            Department.id,
+            Department.name,
+            func.count(StudentFees.id).label('fees'),
+            func.count(func.distinct(StudentFees.student_id)).label('students'),
+            func.sum(balance).label('balance'),
+            *buckets
+        ).select_from(StudentFees).join(
+            Student, Student.id == StudentFees.student_id
+        ).join(
+            Department, Department.id == Student.department_id
+        ).join(
+            FeeStructure, FeeStructure.id == StudentFees.fee_structure_id
+        ).filter(
+            StudentFees.payment_status.in_(PENDING_STATUSES)
+        ).group_by(Department.id, Department.name).order_by(Department.name).all()
+
+        departments = [row._asdict() for row in rows]
+        totals = {key: sum(d[key] or 0 for d in departments)
+                  for key in ['fees', 'students', 'balance'] + [b[0] for b in AGING_BUCKETS]}
+        return departments, totals
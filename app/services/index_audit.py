@@ -0,0 +1,114 @@
+import re
+from datetime import date
+from ..extensions import db
+from ..utils.pagination import PER_PAGE, keyset_query
+from .attendance_service import AttendanceService, SESSION_KEYSET
+from .attendance_analytics import AttendanceAnalytics
+from .marks_service import MarksService
+from .rank_service import RankService
+from .fee_service import FeeService, FEE_SORTS
+
+# "SCAN table" without "USING ... INDEX" means SQLite reads every row
+FULL_SCAN = re.compile(r'^SCAN (?!.*\bUSING\b.*\bINDEX\b)(\w+)')
+# Subqueries SQLite evaluates into a temporary result; scanning those reads no table
+DERIVED = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\w+)')
+
+
+class IndexAudit:
+    @staticmethod
+    def hot_queries():
+        """
+        The hot queries of the attendance, marks and fees pages, built by the
+        same query builders the routes and services use, with placeholder
+        ids. Returns a list of (label, query) pairs.
+        """
+        today = date.today()
+        fee_columns, fee_descending = FEE_SORTS['newest'][:2]
+        return [
+            ('attendance.mark: class students',
+             AttendanceService.class_students_query(1, 1, 'A')),
+            ('attendance.mark: session records',
+             AttendanceService.session_records_query(1)),
+            ('attendance.reports: sessions with counts',
+             keyset_query(AttendanceService.staff_sessions_query(1), SESSION_KEYSET)),
+            ('attendance.today: staff sessions',
+             AttendanceService.day_sessions_query(1, today)),
+            ('attendance.my_attendance: summaries',
+             AttendanceService.student_summaries_query(1)),
+            ('attendance.my_attendance: student records',
+             AttendanceService.recent_records_query(1, 10)),
+            ('attendance low-attendance evaluation',
+             AttendanceService.low_attendance_query(subject_id=1)),
+            ('attendance.analytics: class sessions',
+             AttendanceAnalytics.class_sessions_query(1, 1, 'A')),
+            ('attendance create-sessions: timetable day',
+             AttendanceService.scheduled_slots(today)),
+            ('marks.manage/reports: staff exams',
+             MarksService.staff_exams_query(1).limit(PER_PAGE)),
+            ('marks.enter: exam marks',
+             MarksService.exam_marks_query(1)),
+            ('marks.my_results: student marks',
+             MarksService.student_marks_query(1)),
+            ('marks.my_results: result summaries',
+             MarksService.result_summaries_query(1)),
+            ('marks.rankings: department semester ranks',
+             RankService.ranks_query(1, 1).limit(PER_PAGE)),
+            ('fees.pending_report: pending fees',
+             FeeService.pending_fees_query().limit(PER_PAGE)),
+            ('fees.student_fees_list: newest fees',
+             keyset_query(FeeService.student_fees_query(), fee_columns,
+                          descending=fee_descending)),
+        ]
+
+    @staticmethod
+    def explain(query):
+        """Return the EXPLAIN QUERY PLAN detail lines for a query or SELECT (SQLite only)."""
+        statement = getattr(query, 'statement', query)
+        sql = str(statement.compile(
+            dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}
+        ))
+        rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + sql).all()
+        return [row[-1] for row in rows]
+
+    @staticmethod
+    def run():
+        """
+        Explain every hot query. Returns a list of
+        (label, plan lines, tables read with a full scan).
+        """
+        if db.engine.dialect.name != 'sqlite':
+            raise RuntimeError('The index audit uses EXPLAIN QUERY PLAN and requires SQLite.')
+
+        results = []
+        for label, query in IndexAudit.hot_queries():
+            plan = IndexAudit.explain(query)
+            derived = {m.group(1) for m in map(DERIVED.match, plan) if m}
+            scans = [m.group(1) for m in map(FULL_SCAN.match, plan)
+                     if m and m.group(1) not in derived]
+            results.append((label, plan, scans))
+        return results
+
+    @staticmethod
+    def index_names(inspector, table_name):
+        """Names of the indexes of a table, including expression indexes."""
+        if db.engine.dialect.name == 'sqlite':
+            # SQLAlchemy skips expression indexes when reflecting SQLite
+            with db.engine.connect() as connection:
+                rows = connection.exec_driver_sql(f'PRAGMA index_list({table_name})').all()
+            return {row[1] for row in rows}
+        return {index['name'] for index in inspector.get_indexes(table_name)}
+
+    @staticmethod
+    def create_missing_indexes():
+        """Create model-declared indexes missing from an existing database."""
+        inspector = db.inspect(db.engine)
+        created = []
+        for table in db.metadata.tables.values():
+            if not inspector.has_table(table.name):
+                continue
+            existing = IndexAudit.index_names(inspector, table.name)
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(db.engine)
+                    created.append(index.name)
+        return created
@@ -0,0 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import threading
+from flask import current_app
+from ..extensions import db
+from ..models import BackgroundJob
+from .marks_service import MarksService
+
+
+# job_type -> handler(job); handlers update job.total/processed and commit as they go
+JOB_HANDLERS = {
+    'publish_results': MarksService.publish_results,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class JobQueue:
+    @staticmethod
+    def _get_executor():
+        global _executor
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=current_app.config.get('JOB_WORKERS', 2),
+                    thread_name_prefix='jobs'
+                )
+            return _executor
+
+    @staticmethod
+    def enqueue(job_type, reference_type=None, reference_id=None, created_by=None):
+        """
+        Record a queued job and hand it to the worker pool. Commits, and
+        returns the job (with its Future as `job.future`) without waiting.
+        """
+        job = BackgroundJob(
+            job_type=job_type,
+            reference_type=reference_type,
+            reference_id=reference_id,
+            created_by=created_by
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        app = current_app._get_current_object()
+        job.future = JobQueue._get_executor().submit(JobQueue.run, app, job.id)
+        return job
+
+    @staticmethod
+    def recover_stale(requeue=False):
+        """
+        Release jobs left 'running' for longer than JOB_STALE_AFTER seconds,
+        whose worker died with its server. They are queued again when
+        `requeue` is set and marked failed otherwise. Commits, and returns
+        the number of jobs released.
+        """
+        cutoff = datetime.utcnow() - timedelta(
+            seconds=current_app.config.get('JOB_STALE_AFTER', 3600))
+        values = {'status': 'queued', 'started_at': None} if requeue else {
+            'status': 'failed', 'error': 'The job stopped responding.',
+            'finished_at': datetime.utcnow()
+        }
+        released = BackgroundJob.query.filter(
+            BackgroundJob.status == 'running',
+            BackgroundJob.started_at < cutoff
+        ).update(values, synchronize_session=False)
+        db.session.commit()
+        return released
+
+    @staticmethod
+    def active_job(job_type, reference_type, reference_id):
+        """The queued or running job of a type for a reference, if any."""
+        JobQueue.recover_stale()
+        return BackgroundJob.query.filter(
+            BackgroundJob.job_type == job_type,
+            BackgroundJob.reference_type == reference_type,
+            BackgroundJob.reference_id == reference_id,
+            BackgroundJob.status.in_(['queued', 'running'])
+        ).first()
+
+    @staticmethod
+    def latest_jobs(job_type, reference_type, reference_ids):
+        """Map each reference id to its most recent job of a type, in one query."""
+        if not reference_ids:
+            return {}
+        jobs = BackgroundJob.query.filter(
+            BackgroundJob.job_type == job_type,
+            BackgroundJob.reference_type == reference_type,
+            BackgroundJob.reference_id.in_(reference_ids)
+        ).order_by(BackgroundJob.id).all()
+        return {job.reference_id: job for job in jobs}
+
+    @staticmethod
+    def run(app, job_id):
+        """
+        Run one job inside its own app context. The job is claimed with a
+        conditional UPDATE so a job is never run twice, e.g. by the worker
+        pool and the run-jobs command. Returns whether it completed, or
+        None if it was not queued.
+        """
+        with app.app_context():
+            claimed = BackgroundJob.query.filter_by(id=job_id, status='queued').update(
+                {'status': 'running', 'started_at': datetime.utcnow()},
+                synchronize_session=False
+            )
+            db.session.commit()
+            if not claimed:
+                return None
+
+            job = db.session.get(BackgroundJob, job_id)
+            try:
+                JOB_HANDLERS[job.job_type](job)
+                job.status = 'completed'
+            except Exception as e:
+                db.session.rollback()
+                app.logger.exception('Background job %s failed', job_id)
+                job = db.session.get(BackgroundJob, job_id)
+                job.status = 'failed'
+                job.error = str(e)[:500]
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            return job.status == 'completed'
+
+    @staticmethod
+    def run_pending():
+        """
+        Run queued jobs synchronously, oldest first, e.g. ones left behind
+        by a server restart, including stale running jobs, which are queued
+        again. Returns the number of jobs run.
+        """
+        JobQueue.recover_stale(requeue=True)
+        app = current_app._get_current_object()
+        job_ids = [row[0] for row in db.session.query(BackgroundJob.id).filter_by(
+            status='queued'
+        ).order_by(BackgroundJob.id)]
+        return sum(1 for job_id in job_ids if JobQueue.run(app, job_id) is not None)
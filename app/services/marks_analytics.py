@@ -0,0 +1,234 @@
+from datetime import datetime
+import numpy as np
+from ..extensions import db
+from ..models import Exam, Marks, ExamStatistics
+from ..utils.db import upsert_insert
+from .marks_service import MarksService
+
+
+# An exam where at least this many students sat and all scored the same is flagged
+MIN_IDENTICAL_SCORES = 5
+# Mean percentage jump against the same subject's previous exams that is flagged
+SPIKE_THRESHOLD = 25.0
+# Previous exams with results needed before spikes are checked
+SPIKE_MIN_HISTORY = 2
+
+STAT_COLUMNS = ('department_id', 'count', 'appeared', 'mean', 'median', 'std', 'lowest',
+                'highest', 'mean_percentage', 'pass_rate', 'anomalies', 'anomaly_count',
+                'computed_at')
+
+
+class MarksAnalytics:
+    @staticmethod
+    def load(subject_ids=None):
+        """
+        Load exams (ordered by subject and date) and all their marks as
+        arrays, in one query each. Returns (exams, marks) where exams is a
+        dict of arrays, including each exam's pass percentage from its
+        grading scheme, and marks is (exam position, marks, grade) arrays.
+        """
+        exam_query = db.session.query(
+            Exam.id, Exam.subject_id, Exam.department_id, Exam.max_marks, Exam.exam_type
+        )
+        marks_query = db.session.query(
+            Marks.exam_id, Marks.marks_obtained, Marks.grade
+        ).join(Exam, Exam.id == Marks.exam_id)
+        if subject_ids is not None:
+            exam_query = exam_query.filter(Exam.subject_id.in_(subject_ids))
+            marks_query = marks_query.filter(Exam.subject_id.in_(subject_ids))
+
+        exam_rows = exam_query.order_by(Exam.subject_id, Exam.date, Exam.id).all()
+        mark_rows = marks_query.all()
+        schemes = MarksService.load_schemes()
+
+        exams = {
+            'id': np.array([row[0] for row in exam_rows], dtype=np.int64),
+            'subject_id': np.array([row[1] for row in exam_rows], dtype=np.int64),
+            'department_id': np.array([row[2] for row in exam_rows], dtype=np.int64),
+            'max_marks': np.array([row[3] for row in exam_rows], dtype=float),
+            'pass_percentage': np.array([
+                MarksService.pass_percentage(MarksService.bands_for(schemes, row[2], row[4]))
+                for row in exam_rows
+            ], dtype=float),
+        }
+
+        exam_ids = np.array([row[0] for row in mark_rows], dtype=np.int64)
+        order = np.argsort(exams['id'])
+        position = order[np.searchsorted(exams['id'], exam_ids, sorter=order)] \
+            if len(exam_ids) else np.zeros(0, dtype=np.int64)
+        marks = (
+            position,
+            np.array([row[1] for row in mark_rows], dtype=float),
+            np.array([row[2] or '' for row in mark_rows], dtype=object)
+        )
+        return exams, marks
+
+    @staticmethod
+    def compute(exams, marks):
+        """
+        Per-exam statistics and anomaly flags, vectorized over all exams.
+        A student passes with a percentage at or above the exam's
+        pass_percentage. Returns a dict of arrays aligned with `exams`.
+        """
+        n = len(exams['id'])
+        position, scores, _ = marks
+        sat = ~np.isnan(scores)
+        pos, values = position[sat], scores[sat]
+
+        count = np.bincount(position, minlength=n)
+        appeared = np.bincount(pos, minlength=n)
+        has_results = appeared > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.bincount(pos, weights=values, minlength=n) / appeared
+            mean_square = np.bincount(pos, weights=values ** 2, minlength=n) / appeared
+            std = np.sqrt(np.maximum(mean_square - mean ** 2, 0))
+            percentages = values * 100.0 / exams['max_marks'][pos]
+            passed = np.bincount(pos[percentages >= exams['pass_percentage'][pos]], minlength=n)
+            pass_rate = passed * 100.0 / appeared
+            mean_percentage = mean * 100.0 / exams['max_marks']
+
+        # Sort scores within each exam for min, max and median
+        order = np.lexsort((values, pos))
+        sorted_pos, sorted_values = pos[order], values[order]
+        start = np.searchsorted(sorted_pos, np.arange(n), side='left')
+        last = np.maximum(start + appeared - 1, 0)
+        lowest = np.full(n, np.nan)
+        highest = np.full(n, np.nan)
+        median = np.full(n, np.nan)
+        if len(sorted_values):
+            idx = np.flatnonzero(has_results)
+            lowest[idx] = sorted_values[start[idx]]
+            highest[idx] = sorted_values[last[idx]]
+            median[idx] = (sorted_values[start[idx] + (appeared[idx] - 1) // 2]
+                           + sorted_values[start[idx] + appeared[idx] // 2]) / 2
+
+        out_of_range = sat.copy()
+        out_of_range[sat] = (values > exams['max_marks'][pos]) | (values < 0)
+        invalid = np.bincount(position[out_of_range], minlength=n)
+
+        identical = (appeared >= MIN_IDENTICAL_SCORES) & (lowest == highest)
+
+        # Mean percentage of earlier exams of the same subject (exams are ordered by subject, date)
+        subjects = exams['subject_id']
+        valid = has_results.astype(np.int64)
+        pct = np.where(has_results, mean_percentage, 0.0)
+        group_start = np.searchsorted(subjects, subjects, side='left')
+        cum_pct, cum_valid = np.cumsum(pct), np.cumsum(valid)
+        prior_pct = cum_pct - pct - (cum_pct[group_start] - pct[group_start])
+        prior_count = cum_valid - valid - (cum_valid[group_start] - valid[group_start])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            prior_mean = prior_pct / prior_count
+        spike = has_results & (prior_count >= SPIKE_MIN_HISTORY) & \
+            (np.abs(mean_percentage - prior_mean) >= SPIKE_THRESHOLD)
+
+        return {
+            'count': count, 'appeared': appeared, 'mean': mean, 'median': median,
+            'std': std, 'lowest': lowest, 'highest': highest,
+            'mean_percentage': mean_percentage, 'pass_rate': pass_rate,
+            'invalid': invalid, 'identical': identical, 'spike': spike,
+            'prior_mean': prior_mean
+        }
+
+    @staticmethod
+    def exam_statistics(exam, marks, schemes=None):
+        """
+        Distribution statistics and grade histogram of one exam from its
+        Marks rows, through the same compute() as the cached statistics.
+        Pass `schemes` from MarksService.load_schemes() when summarising
+        several exams.
+        """
+        bands = (MarksService.bands_for(schemes, exam.department_id, exam.exam_type)
+                 if schemes is not None else MarksService.bands_for_exam(exam))
+        exams = {
+            'id': np.array([exam.id], dtype=np.int64),
+            'subject_id': np.array([exam.subject_id], dtype=np.int64),
+            'department_id': np.array([exam.department_id], dtype=np.int64),
+            'max_marks': np.array([exam.max_marks], dtype=float),
+            'pass_percentage': np.array([MarksService.pass_percentage(bands)], dtype=float),
+        }
+        grades = np.array([m.grade or '' for m in marks], dtype=object)
+        stats = MarksAnalytics.compute(exams, (
+            np.zeros(len(marks), dtype=np.int64),
+            np.array([m.marks_obtained for m in marks], dtype=float),
+            grades
+        ))
+
+        grade_labels, grade_counts = np.unique(grades.astype(str), return_counts=True)
+        result = {
+            'count': int(stats['count'][0]),
+            'appeared': int(stats['appeared'][0]),
+            'absent': int(stats['count'][0] - stats['appeared'][0]),
+            'histogram': dict(zip(grade_labels.tolist(), grade_counts.tolist()))
+        }
+        if result['appeared']:
+            result.update({name: float(stats[name][0]) for name in (
+                'mean', 'median', 'std', 'highest', 'lowest', 'mean_percentage', 'pass_rate'
+            )})
+        return result
+
+    @staticmethod
+    def _anomalies(stats, i):
+        anomalies = []
+        if stats['invalid'][i]:
+            anomalies.append({
+                'type': 'out_of_range',
+                'message': f"{int(stats['invalid'][i])} marks are above the maximum or negative."
+            })
+        if stats['identical'][i]:
+            anomalies.append({
+                'type': 'identical_scores',
+                'message': f"All {int(stats['appeared'][i])} students scored {stats['lowest'][i]:g}."
+            })
+        if stats['spike'][i]:
+            anomalies.append({
+                'type': 'spike',
+                'message': f"Mean {stats['mean_percentage'][i]:.1f}% against "
+                           f"{stats['prior_mean'][i]:.1f}% in earlier exams of the subject."
+            })
+        return anomalies
+
+    @staticmethod
+    def refresh(subject_ids=None):
+        """
+        Recompute the cached statistics of every exam of the given subjects
+        (all exams when None), from one marks query and one vectorized pass,
+        and upsert them into exam_statistics. Returns the number of exams.
+        The caller commits.
+        """
+        exams, marks = MarksAnalytics.load(subject_ids)
+        if not len(exams['id']):
+            return 0
+        stats = MarksAnalytics.compute(exams, marks)
+
+        def number(name, i):
+            value = stats[name][i]
+            return None if np.isnan(value) else float(value)
+
+        now = datetime.utcnow()
+        rows = []
+        for i, exam_id in enumerate(exams['id'].tolist()):
+            anomalies = MarksAnalytics._anomalies(stats, i)
+            rows.append({
+                'exam_id': exam_id,
+                'department_id': int(exams['department_id'][i]),
+                'count': int(stats['count'][i]),
+                'appeared': int(stats['appeared'][i]),
+                'mean': number('mean', i),
+                'median': number('median', i),
+                'std': number('std', i),
+                'lowest': number('lowest', i),
+                'highest': number('highest', i),
+                'mean_percentage': number('mean_percentage', i),
+                'pass_rate': number('pass_rate', i),
+                'anomalies': anomalies,
+                'anomaly_count': len(anomalies),
+                'computed_at': now
+            })
+
+        stmt = upsert_insert(ExamStatistics)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['exam_id'],
+            set_={column: stmt.excluded[column] for column in STAT_COLUMNS}
+        )
+        db.session.execute(stmt, rows)
+        return len(rows)
@@ -0,0 +1,112 @@
+import csv
+import io
+import tempfile
+from ..extensions import db
+from ..models import Exam, Marks, Student, Subject, Department
+
+
+EXPORT_BATCH_SIZE = 1000
+XLSX_CHUNK_SIZE = 64 * 1024
+
+EXPORT_HEADER = ['Exam Date', 'Exam', 'Exam Type', 'Subject Code', 'Subject', 'Department',
+                 'Year', 'Section', 'Roll Number', 'Student', 'Marks', 'Max Marks', 'Grade']
+
+
+class MarksExport:
+    @staticmethod
+    def build_query(department_id=None, year=None, section=None, exam_type=None,
+                    date_from=None, date_to=None, created_by=None):
+        """
+        Column-only SELECT of marks joined to students and exams, ordered by
+        exam and roll number. Every filter is optional.
+        """
+        stmt = db.select(
+            Exam.date, Exam.name, Exam.exam_type, Subject.code, Subject.name,
+            Department.code, Exam.year, Exam.section, Student.roll_number, Student.name,
+            Marks.marks_obtained, Exam.max_marks, Marks.grade
+        ).select_from(Marks).join(
+            Exam, Exam.id == Marks.exam_id
+        ).join(
+            Student, Student.id == Marks.student_id
+        ).join(
+            Subject, Subject.id == Exam.subject_id
+        ).join(
+            Department, Department.id == Exam.department_id
+        )
+
+        if department_id:
+            stmt = stmt.where(Exam.department_id == department_id)
+        if year:
+            stmt = stmt.where(Exam.year == year)
+        if section:
+            stmt = stmt.where(Exam.section == section)
+        if exam_type:
+            stmt = stmt.where(Exam.exam_type == exam_type)
+        if date_from:
+            stmt = stmt.where(Exam.date >= date_from)
+        if date_to:
+            stmt = stmt.where(Exam.date <= date_to)
+        if created_by:
+            stmt = stmt.where(Exam.created_by == created_by)
+
+        return stmt.order_by(Exam.date, Exam.id, Student.roll_number)
+
+    @staticmethod
+    def iter_rows(stmt):
+        """Yield export rows, fetched from the database EXPORT_BATCH_SIZE at a time."""
+        result = db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for (exam_date, exam, exam_type, code, subject, department, year, section,
+             roll_number, student, marks, max_marks, grade) in result:
+            yield [
+                exam_date.isoformat() if exam_date else '',
+                exam, exam_type, code, subject, department, year, section,
+                roll_number, student,
+                'AB' if marks is None else marks,
+                max_marks, grade or ''
+            ]
+
+    @staticmethod
+    def iter_csv(stmt):
+        """Yield the export as UTF-8 CSV text, one chunk per fetched batch."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_HEADER)
+        for count, row in enumerate(MarksExport.iter_rows(stmt), start=1):
+            writer.writerow(row)
+            if count % EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    @staticmethod
+    def xlsx_available():
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    @staticmethod
+    def iter_xlsx(stmt):
+        """
+        Yield the export as an XLSX file. openpyxl's write-only workbook
+        spools rows to disk as they are added, so memory stays flat; the
+        finished file is then streamed back in chunks.
+        """
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('Marks')
+        sheet.append(EXPORT_HEADER)
+        for row in MarksExport.iter_rows(stmt):
+            sheet.append(row)
+
+        with tempfile.TemporaryFile() as spool:
+            workbook.save(spool)
+            spool.seek(0)
+            while True:
+                chunk = spool.read(XLSX_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
@@ -0,0 +1,138 @@
+import csv
+import io
+from ..models import Student
+from .marks_service import MarksService
+
+
+IMPORT_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 500
+
+ROLL_COLUMNS = ('roll_number', 'roll number', 'roll no', 'roll')
+MARKS_COLUMNS = ('marks', 'marks_obtained', 'marks obtained', 'score')
+ABSENT_VALUES = ('ab', 'absent', 'a')
+
+
+class MarksImportError(Exception):
+    """Raised when an uploaded marks file cannot be read at all."""
+
+
+class MarksImport:
+    @staticmethod
+    def iter_rows(file):
+        """
+        Stream rows of an uploaded CSV or XLSX file as tuples of cells,
+        without loading the whole file into memory.
+        """
+        filename = (file.filename or '').lower()
+        if filename.endswith('.xlsx'):
+            try:
+                from openpyxl import load_workbook
+            except ImportError:
+                raise MarksImportError('XLSX import requires the openpyxl package.')
+            try:
+                workbook = load_workbook(file.stream, read_only=True, data_only=True)
+            except Exception:
+                raise MarksImportError('The uploaded file is not a valid XLSX workbook.')
+            try:
+                yield from workbook.active.iter_rows(values_only=True)
+            finally:
+                workbook.close()
+        elif filename.endswith('.csv'):
+            try:
+                yield from csv.reader(io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline=''))
+            except (UnicodeDecodeError, csv.Error):
+                raise MarksImportError('The file is not a valid UTF-8 CSV file.')
+        else:
+            raise MarksImportError('Upload a .csv or .xlsx file.')
+
+    @staticmethod
+    def _cell(row, index):
+        value = row[index] if index < len(row) else None
+        return '' if value is None else str(value).strip()
+
+    @staticmethod
+    def _find_column(header, names):
+        for index, cell in enumerate(header):
+            if str(cell or '').strip().lower() in names:
+                return index
+        return None
+
+    @staticmethod
+    def import_exam_marks(exam, rows):
+        """
+        Validate and save marks from an iterable of rows whose first row is
+        a header with roll number and marks columns. Roll numbers are checked
+        against a preloaded dict of the exam's class and valid rows are
+        written in chunked bulk upserts. The caller commits.
+        Returns a report dict with imported/updated students and row errors.
+        """
+        rows = iter(rows)
+        header = next(rows, None)
+        if header is None:
+            raise MarksImportError('The uploaded file is empty.')
+        roll_col = MarksImport._find_column(header, ROLL_COLUMNS)
+        marks_col = MarksImport._find_column(header, MARKS_COLUMNS)
+        if roll_col is None or marks_col is None:
+            raise MarksImportError('The first row must contain "roll_number" and "marks" columns.')
+
+        students = {s.roll_number: s for s in Student.query.filter_by(
+            department_id=exam.department_id,
+            year=exam.year,
+            section=exam.section
+        )}
+        students_by_id = {s.id: s for s in students.values()}
+
+        report = {'imported': 0, 'updated': [], 'errors': [], 'error_count': 0}
+        seen = set()
+        chunk = {}
+
+        def error(row_number, roll_number, message):
+            report['error_count'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append((row_number, roll_number, message))
+
+        def flush():
+            if chunk:
+                updated = set(MarksService.save_exam_marks(exam, chunk))
+                report['updated'].extend(students_by_id[sid] for sid in updated)
+                report['imported'] += len(chunk)
+                chunk.clear()
+
+        for row_number, row in enumerate(rows, start=2):
+            if not row or all(cell is None or str(cell).strip() == '' for cell in row):
+                continue
+            roll_number = MarksImport._cell(row, roll_col)
+            raw_marks = MarksImport._cell(row, marks_col)
+            if raw_marks == '':
+                # Blank marks are left untouched, as in the entry form
+                continue
+
+            student = students.get(roll_number)
+            if student is None:
+                error(row_number, roll_number,
+                      f'Not a student of Year {exam.year} - {exam.section}.')
+                continue
+            if student.id in seen:
+                error(row_number, roll_number, 'Duplicate roll number in file.')
+                continue
+
+            if raw_marks.lower() in ABSENT_VALUES:
+                marks = None
+            else:
+                try:
+                    marks = float(raw_marks)
+                except (TypeError, ValueError):
+                    error(row_number, roll_number, f'Invalid marks "{raw_marks}".')
+                    continue
+                if not 0 <= marks <= exam.max_marks:
+                    error(row_number, roll_number,
+                          f'Marks {marks:g} outside 0 - {exam.max_marks}.')
+                    continue
+
+            seen.add(student.id)
+            chunk[student.id] = marks
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                flush()
+
+        flush()
+        return report
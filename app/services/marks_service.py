@@ -0,0 +1,325 @@
+from datetime import datetime
+import numpy as np
+from ..extensions import db
+from sqlalchemy import case, func
+from sqlalchemy.orm import contains_eager, selectinload
+from ..models import Exam, Marks, Student, Subject, GradingScheme, StudentResultSummary, Notification
+from ..models.marks import DEFAULT_GRADE_BANDS
+from ..utils.db import upsert_insert
+from .notification_service import NotificationService
+
+
+# Grade points on a 10-point scale as (minimum subject percentage, points), ascending
+GRADE_POINT_BANDS = ((0, 0), (40, 5), (50, 6), (60, 7), (70, 8), (80, 9), (90, 10))
+RESULT_REBUILD_CHUNK = 500
+PUBLISH_CHUNK_SIZE = 1000
+
+
+class MarksService:
+    @staticmethod
+    def grade_array(marks_obtained, max_marks, bands=DEFAULT_GRADE_BANDS):
+        """
+        Grade a whole array of marks at once against (min percentage, grade)
+        bands. Missing marks (None/NaN) are graded 'AB' (absent).
+        Returns a list of grade strings.
+        """
+        minimums = np.array([minimum for minimum, _ in bands], dtype=float)
+        labels = np.array([grade for _, grade in bands])
+        marks = np.array(marks_obtained, dtype=float)
+        percentage = np.nan_to_num(marks / max_marks * 100)
+        index = np.maximum(np.searchsorted(minimums, percentage, side='right') - 1, 0)
+        return np.where(np.isnan(marks), 'AB', labels[index]).tolist()
+
+    @staticmethod
+    def _specificity(scheme):
+        # Department and exam type together beat department alone, which beats exam type alone
+        return (scheme.department_id is not None) * 2 + (scheme.exam_type is not None)
+
+    @staticmethod
+    def load_schemes():
+        """Every grading scheme with its bands, for resolving many exams at once."""
+        return GradingScheme.query.options(selectinload(GradingScheme.bands)).all()
+
+    @staticmethod
+    def bands_for(schemes, department_id, exam_type):
+        """Bands of the most specific of `schemes` matching a scope, or the defaults."""
+        schemes = [scheme for scheme in schemes
+                   if scheme.bands
+                   and scheme.department_id in (None, department_id)
+                   and scheme.exam_type in (None, exam_type)]
+        if not schemes:
+            return DEFAULT_GRADE_BANDS
+        return max(schemes, key=MarksService._specificity).band_tuples()
+
+    @staticmethod
+    def bands_for_exam(exam):
+        """Bands of the most specific grading scheme matching an exam, or the defaults."""
+        schemes = GradingScheme.query.options(selectinload(GradingScheme.bands)).filter(
+            db.or_(GradingScheme.department_id == exam.department_id,
+                   GradingScheme.department_id.is_(None)),
+            db.or_(GradingScheme.exam_type == exam.exam_type,
+                   GradingScheme.exam_type.is_(None))
+        ).all()
+        return MarksService.bands_for(schemes, exam.department_id, exam.exam_type)
+
+    @staticmethod
+    def pass_percentage(bands):
+        """The lowest band is the failing grade; passing starts at the next band's minimum."""
+        return float(bands[1][0]) if len(bands) > 1 else 0.0
+
+    @staticmethod
+    def staff_exams_query(staff_id):
+        """Exams created by a staff member, newest first, with their subjects."""
+        return Exam.query.options(selectinload(Exam.subject)).filter_by(
+            created_by=staff_id
+        ).order_by(Exam.date.desc(), Exam.id.desc())
+
+    @staticmethod
+    def exam_marks_query(exam_id):
+        """Marks of an exam."""
+        return Marks.query.filter_by(exam_id=exam_id)
+
+    @staticmethod
+    def student_marks_query(student_id):
+        """Marks of a student with their exams and subjects, by subject name then newest."""
+        return Marks.query.join(Marks.exam).join(Exam.subject).options(
+            contains_eager(Marks.exam).contains_eager(Exam.subject)
+        ).filter(Marks.student_id == student_id).order_by(
+            Subject.name, Marks.entered_at.desc()
+        )
+
+    @staticmethod
+    def result_summaries_query(student_id):
+        """Result summaries of a student by semester."""
+        return StudentResultSummary.query.filter_by(
+            student_id=student_id
+        ).order_by(StudentResultSummary.semester)
+
+    @staticmethod
+    def regrade(department_id=None, semester=None):
+        """
+        Recompute stored grades with one set-based UPDATE per grading scheme,
+        applied from least to most specific so the most specific scheme wins.
+        Optionally limited to a department and/or subject semester.
+        Returns the number of marks in scope. The caller commits.
+        """
+        max_marks = db.select(Exam.max_marks).where(Exam.id == Marks.exam_id).scalar_subquery()
+        percentage = Marks.marks_obtained * 100.0 / max_marks
+
+        def grade_case(bands):
+            return case(
+                (Marks.marks_obtained.is_(None), 'AB'),
+                *[(percentage >= minimum, grade) for minimum, grade in reversed(bands[1:])],
+                else_=bands[0][1]
+            )
+
+        def exams_in_scope(scheme=None):
+            exams = db.select(Exam.id)
+            if semester is not None:
+                exams = exams.join(Subject).where(Subject.semester == semester)
+            if department_id is not None:
+                exams = exams.where(Exam.department_id == department_id)
+            if scheme is not None and scheme.department_id is not None:
+                exams = exams.where(Exam.department_id == scheme.department_id)
+            if scheme is not None and scheme.exam_type is not None:
+                exams = exams.where(Exam.exam_type == scheme.exam_type)
+            return exams
+
+        def update(bands, scheme=None):
+            return db.session.execute(
+                db.update(Marks).where(Marks.exam_id.in_(exams_in_scope(scheme)))
+                .values(grade=grade_case(bands))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+
+        count = update(DEFAULT_GRADE_BANDS)
+        schemes = GradingScheme.query.options(selectinload(GradingScheme.bands)).all()
+        for scheme in sorted(schemes, key=MarksService._specificity):
+            if scheme.bands:
+                update(scheme.band_tuples(), scheme)
+        return count
+
+    @staticmethod
+    def save_exam_marks(exam, entries):
+        """
+        Save marks for an exam; `entries` maps student_id to marks obtained.
+        Existing marks are prefetched in one query, all rows are graded in a
+        single vectorized pass against the exam's grading scheme and written with one INSERT ... ON CONFLICT.
+        Returns the ids of students whose marks were new or changed.
+        The caller commits.
+        """
+        if not entries:
+            return []
+
+        existing = dict(
+            db.session.query(Marks.student_id, Marks.marks_obtained)
+            .filter(Marks.exam_id == exam.id)
+            .all()
+        )
+
+        student_ids = list(entries)
+        grades = MarksService.grade_array([entries[sid] for sid in student_ids], exam.max_marks,
+                                          MarksService.bands_for_exam(exam))
+        now = datetime.utcnow()
+        rows = [{
+            'exam_id': exam.id,
+            'student_id': student_id,
+            'marks_obtained': entries[student_id],
+            'grade': grade,
+            'entered_at': now
+        } for student_id, grade in zip(student_ids, grades)]
+
+        stmt = upsert_insert(Marks)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['exam_id', 'student_id'],
+            set_={
+                'marks_obtained': stmt.excluded.marks_obtained,
+                'grade': stmt.excluded.grade,
+                'entered_at': stmt.excluded.entered_at
+            }
+        )
+        db.session.execute(stmt, rows)
+
+        return [sid for sid in student_ids
+                if sid not in existing or existing[sid] != entries[sid]]
+
+    @staticmethod
+    def publish_results(job):
+        """
+        Background job: notify every student with marks for the exam
+        `job.reference_id`, in bulk inserts of PUBLISH_CHUNK_SIZE
+        notifications, committing progress on the job after each chunk.
+        Students already notified of the exam are skipped, so a failed or
+        interrupted run can simply be published again.
+        """
+        exam = db.session.get(Exam, job.reference_id)
+        if exam is None:
+            raise ValueError(f'Exam {job.reference_id} no longer exists.')
+
+        message = f'Your result for {exam.name} in {exam.subject.name} has been uploaded.'
+        # Students notified by an earlier (possibly interrupted) run are skipped
+        notified = db.session.query(Notification.id).filter(
+            Notification.user_id == Student.user_id,
+            Notification.notification_type == 'result_uploaded',
+            Notification.reference_type == 'marks',
+            Notification.reference_id == exam.id
+        ).exists()
+        students = db.session.query(Student.user_id).join(
+            Marks, Marks.student_id == Student.id
+        ).filter(Marks.exam_id == exam.id)
+        user_ids = [row[0] for row in students.filter(~notified).order_by(Student.id)]
+
+        job.total = students.count()
+        job.processed = job.total - len(user_ids)
+        db.session.commit()
+
+        for start in range(0, len(user_ids), PUBLISH_CHUNK_SIZE):
+            now = datetime.utcnow()
+            job.processed += NotificationService.create_notifications([{
+                'user_id': user_id,
+                'notification_type': 'result_uploaded',
+                'title': 'Result Published',
+                'message': message,
+                'reference_type': 'marks',
+                'reference_id': exam.id,
+                'created_at': now
+            } for user_id in user_ids[start:start + PUBLISH_CHUNK_SIZE]])
+            db.session.commit()
+
+    @staticmethod
+    def grade_points(percentages):
+        """Map an array of subject percentages to 10-point grade points."""
+        minimums = np.array([minimum for minimum, _ in GRADE_POINT_BANDS], dtype=float)
+        points = np.array([point for _, point in GRADE_POINT_BANDS], dtype=float)
+        index = np.maximum(np.searchsorted(minimums, percentages, side='right') - 1, 0)
+        return points[index]
+
+    @staticmethod
+    def refresh_result_summaries(student_ids):
+        """
+        Recompute the SGPA/CGPA rows of the given students. A subject's
+        percentage is the marks obtained over the max marks of all its exams
+        (absent counts as zero), its grade point is weighted by Subject.credits,
+        and CGPA accumulates the semesters in order. Per-subject totals come
+        from one GROUP BY query; the work is proportional to the students
+        affected, not to the whole marks table. The caller commits.
+        """
+        student_ids = list(set(student_ids))
+        if not student_ids:
+            return 0
+
+        totals = db.session.query(
+            Marks.student_id,
+            Subject.semester,
+            func.coalesce(Subject.credits, 0),
+            func.sum(func.coalesce(Marks.marks_obtained, 0)),
+            func.sum(Exam.max_marks)
+        ).join(Exam, Exam.id == Marks.exam_id).join(Subject, Subject.id == Exam.subject_id).filter(
+            Marks.student_id.in_(student_ids)
+        ).group_by(Marks.student_id, Subject.id).all()
+
+        semesters = {}
+        if totals:
+            data = np.array([row[2:] for row in totals], dtype=float)
+            credits, obtained, maximum = data[:, 0], data[:, 1], data[:, 2]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                percentage = np.where(maximum > 0, obtained * 100.0 / maximum, 0.0)
+            weighted = credits * MarksService.grade_points(percentage)
+            for (student_id, semester, *_), subject_credits, points in zip(
+                    totals, credits.tolist(), weighted.tolist()):
+                entry = semesters.setdefault((student_id, semester), [0, 0, 0.0])
+                entry[0] += 1
+                entry[1] += int(subject_credits)
+                entry[2] += points
+
+        now = datetime.utcnow()
+        rows = []
+        cumulative = {}
+        for (student_id, semester), (subjects, credits, points) in sorted(semesters.items()):
+            total_credits, total_points = cumulative.get(student_id, (0, 0.0))
+            total_credits += credits
+            total_points += points
+            cumulative[student_id] = (total_credits, total_points)
+            rows.append({
+                'student_id': student_id,
+                'semester': semester,
+                'subjects': subjects,
+                'credits': credits,
+                'credit_points': points,
+                'sgpa': round(points / credits, 2) if credits else 0.0,
+                'cgpa': round(total_points / total_credits, 2) if total_credits else 0.0,
+                'last_updated': now
+            })
+
+        # Semesters that no longer have any marks (e.g. exams deleted)
+        stale = StudentResultSummary.query.filter(StudentResultSummary.student_id.in_(student_ids))
+        if rows:
+            stale = stale.filter(db.tuple_(
+                StudentResultSummary.student_id, StudentResultSummary.semester
+            ).notin_(list(semesters)))
+        stale.delete(synchronize_session=False)
+
+        if rows:
+            stmt = upsert_insert(StudentResultSummary)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['student_id', 'semester'],
+                set_={column: stmt.excluded[column] for column in
+                      ('subjects', 'credits', 'credit_points', 'sgpa', 'cgpa', 'last_updated')}
+            )
+            db.session.execute(stmt, rows)
+        return len(rows)
+
+    @staticmethod
+    def rebuild_result_summaries():
+        """
+        Recompute every student's result summaries in chunks of students.
+        Returns the number of summary rows written. The caller commits.
+        """
+        StudentResultSummary.query.delete(synchronize_session=False)
+        student_ids = [row[0] for row in db.session.query(Marks.student_id).distinct()]
+        count = 0
+        for start in range(0, len(student_ids), RESULT_REBUILD_CHUNK):
+            count += MarksService.refresh_result_summaries(
+                student_ids[start:start + RESULT_REBUILD_CHUNK]
+            )
+        return count
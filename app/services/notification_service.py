@@ -19,6 +19,17 @@ class NotificationService:
         db.session.commit()
         return notification
 
+    @staticmethod
+    def create_notifications(notifications):
+        """
+        Insert many notifications with a single executemany.
+        Each item is a dict of Notification columns; the caller commits.
+        """
+        if not notifications:
+            return 0
+        db.session.execute(db.insert(Notification), notifications)
+        return len(notifications)
+
     @staticmethod
     def notify_low_attendance(student, subject, percentage):
         """Notify student and staff about low attendance."""
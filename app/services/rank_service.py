@@ -0,0 +1,191 @@
+from datetime import datetime
+import numpy as np
+from sqlalchemy import func, literal, null
+from sqlalchemy.orm import contains_eager
+from ..extensions import db
+from ..models import Exam, Marks, Subject, Student, StudentResultSummary, StudentRank
+
+
+RANK_COLUMNS = ['student_id', 'exam_id', 'semester', 'department_id', 'score',
+                'section_rank', 'section_percentile', 'department_rank',
+                'department_percentile', 'computed_at']
+
+
+class RankService:
+    @staticmethod
+    def window_functions_supported():
+        """SQLite only has window functions from 3.25 on."""
+        dialect = db.engine.dialect
+        return dialect.name != 'sqlite' or dialect.server_version_info >= (3, 25)
+
+    @staticmethod
+    def rank_arrays(groups, scores):
+        """
+        Dense ranks (1 = highest score) and percentiles of `scores` within
+        each group label of `groups`, in one sort. The percentile is
+        100 * (1 - percent_rank), matching the SQL window functions.
+        """
+        n = len(scores)
+        if not n:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        order = np.lexsort((-scores, groups))
+        positions = np.arange(n)
+        g, s = groups[order], scores[order]
+        new_group = np.r_[True, g[1:] != g[:-1]]
+        new_score = new_group | np.r_[True, s[1:] != s[:-1]]
+
+        group_start = np.maximum.accumulate(np.where(new_group, positions, 0))
+        tie_start = np.maximum.accumulate(np.where(new_score, positions, 0))
+        distinct = np.cumsum(new_score)
+        dense = distinct - distinct[group_start] + 1
+        rank = tie_start - group_start + 1
+
+        _, group_index, group_sizes = np.unique(g, return_inverse=True, return_counts=True)
+        size = group_sizes[group_index]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percent_rank = np.where(size > 1, (rank - 1) / (size - 1), 0.0)
+
+        dense_out = np.empty(n, dtype=np.int64)
+        percentile_out = np.empty(n)
+        dense_out[order] = dense
+        percentile_out[order] = 100.0 * (1 - percent_rank)
+        return dense_out, percentile_out
+
+    @staticmethod
+    def _sources(department_id, semester):
+        """
+        The ranked populations of a department semester, as
+        (select_from, filters, columns, score, section partition, department partition):
+        exam percentages ranked within the exam (one section) and across
+        sections sitting the same exam, and SGPAs ranked within the section
+        and the whole department semester.
+        """
+        exam_score = Marks.marks_obtained * 100.0 / Exam.max_marks
+        exams = (
+            db.select(Marks).join(Exam, Exam.id == Marks.exam_id)
+            .join(Subject, Subject.id == Exam.subject_id)
+            .where(Exam.department_id == department_id,
+                   Subject.semester == semester,
+                   Marks.marks_obtained.isnot(None)),
+            [Marks.student_id, Marks.exam_id, literal(semester), Exam.department_id],
+            exam_score,
+            [Marks.exam_id],
+            [Exam.subject_id, Exam.exam_type, Exam.name]
+        )
+        semesters = (
+            db.select(StudentResultSummary)
+            .join(Student, Student.id == StudentResultSummary.student_id)
+            .where(Student.department_id == department_id,
+                   StudentResultSummary.semester == semester),
+            [StudentResultSummary.student_id, null(), StudentResultSummary.semester,
+             Student.department_id],
+            StudentResultSummary.sgpa,
+            [Student.year, Student.section],
+            []
+        )
+        return [exams, semesters]
+
+    @staticmethod
+    def _insert_with_window_functions(base, columns, score, section_by, department_by, now):
+        def rank(partition):
+            return func.dense_rank().over(partition_by=partition or None, order_by=score.desc())
+
+        def percentile(partition):
+            return 100.0 * (1 - func.percent_rank().over(
+                partition_by=partition or None, order_by=score.desc()))
+
+        ranked = base.with_only_columns(
+            *columns, score,
+            rank(section_by), percentile(section_by),
+            rank(department_by), percentile(department_by),
+            literal(now, db.DateTime)
+        )
+        return db.session.execute(
+            db.insert(StudentRank).from_select(RANK_COLUMNS, ranked)
+        ).rowcount
+
+    @staticmethod
+    def _insert_with_numpy(base, columns, score, section_by, department_by, now):
+        rows = db.session.execute(
+            base.with_only_columns(*columns, score, *section_by, *department_by)
+        ).all()
+        if not rows:
+            return 0
+
+        width = len(columns) + 1
+        scores = np.array([row[width - 1] for row in rows], dtype=float)
+
+        def labels(start, count):
+            # Integer label per distinct partition key
+            keys = {}
+            return np.array([keys.setdefault(tuple(row[start:start + count]), len(keys))
+                             for row in rows], dtype=np.int64)
+
+        section_rank, section_pct = RankService.rank_arrays(
+            labels(width, len(section_by)), scores)
+        department_rank, department_pct = RankService.rank_arrays(
+            labels(width + len(section_by), len(department_by)), scores)
+
+        db.session.execute(db.insert(StudentRank), [
+            dict(zip(RANK_COLUMNS, (*row[:width], int(section_rank[i]), float(section_pct[i]),
+                                    int(department_rank[i]), float(department_pct[i]), now)))
+            for i, row in enumerate(rows)
+        ])
+        return len(rows)
+
+    @staticmethod
+    def refresh(department_id, semester):
+        """
+        Recompute every exam and SGPA rank of a department semester in one
+        pass per population: window functions rank the whole department
+        inside an INSERT ... SELECT, or a single NumPy sort does on SQLite
+        builds without window functions. Returns the number of ranks
+        written. The caller commits.
+        """
+        StudentRank.query.filter_by(
+            department_id=department_id, semester=semester
+        ).delete(synchronize_session=False)
+
+        insert = (RankService._insert_with_window_functions
+                  if RankService.window_functions_supported()
+                  else RankService._insert_with_numpy)
+        now = datetime.utcnow()
+        return sum(insert(*source, now) for source in RankService._sources(department_id, semester))
+
+    @staticmethod
+    def refresh_for_exam(exam):
+        """Refresh the ranks of the department semester an exam belongs to."""
+        return RankService.refresh(exam.department_id, exam.subject.semester)
+
+    @staticmethod
+    def refresh_all():
+        """
+        Recompute ranks for every department semester with marks.
+        Returns the number of ranks written. The caller commits.
+        """
+        StudentRank.query.delete(synchronize_session=False)
+        scopes = db.session.query(Exam.department_id, Subject.semester).join(
+            Subject, Subject.id == Exam.subject_id
+        ).distinct().all()
+        count = 0
+        for department_id, semester in scopes:
+            count += RankService.refresh(department_id, semester)
+        return count
+
+    @staticmethod
+    def ranks_query(department_id, semester, exam_id=None, section=''):
+        """
+        Ranks of a department semester with their students, best first;
+        SGPA ranks unless `exam_id` is given, optionally of one section.
+        """
+        query = StudentRank.query.join(StudentRank.student).options(
+            contains_eager(StudentRank.student)
+        ).filter(
+            StudentRank.department_id == department_id,
+            StudentRank.semester == semester,
+            StudentRank.exam_id == exam_id if exam_id else StudentRank.exam_id.is_(None)
+        )
+        if section:
+            query = query.filter(Student.section == section)
+        return query.order_by(StudentRank.department_rank, Student.roll_number)
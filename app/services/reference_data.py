@@ -0,0 +1,108 @@
+from collections import namedtuple
+import threading
+import time
+from flask import current_app
+from ..models import Department, Subject, Staff, PeriodTiming
+
+
+DEFAULT_TTL = 300  # Seconds, when REFERENCE_CACHE_TTL is not configured
+
+DepartmentRef = namedtuple('DepartmentRef', 'id code name')
+SubjectRef = namedtuple('SubjectRef', 'id code name department_id year semester')
+StaffRef = namedtuple('StaffRef', 'id name department_id')
+PeriodTimingRef = namedtuple('PeriodTimingRef', 'period start_time end_time is_break break_name')
+
+
+def _load_departments():
+    return tuple(DepartmentRef(*row) for row in Department.query.with_entities(
+        Department.id, Department.code, Department.name
+    ).order_by(Department.name))
+
+
+def _load_subjects():
+    return tuple(SubjectRef(*row) for row in Subject.query.with_entities(
+        Subject.id, Subject.code, Subject.name, Subject.department_id,
+        Subject.year, Subject.semester
+    ).order_by(Subject.code))
+
+
+def _load_staff():
+    return tuple(StaffRef(*row) for row in Staff.query.with_entities(
+        Staff.id, Staff.name, Staff.department_id
+    ).order_by(Staff.name))
+
+
+def _load_period_timings():
+    return tuple(PeriodTimingRef(*row) for row in PeriodTiming.query.with_entities(
+        PeriodTiming.period, PeriodTiming.start_time, PeriodTiming.end_time,
+        PeriodTiming.is_break, PeriodTiming.break_name
+    ).order_by(PeriodTiming.period))
+
+
+LOADERS = {
+    'departments': _load_departments,
+    'subjects': _load_subjects,
+    'staff': _load_staff,
+    'period_timings': _load_period_timings,
+}
+
+_cache = {}  # name -> (expires_at, rows)
+_lock = threading.Lock()
+
+
+class ReferenceData:
+    """
+    Per-process cache of the small master tables used to build form choices.
+    Rows are immutable tuples, so they are safe to share across requests.
+    Entries expire after REFERENCE_CACHE_TTL seconds and are dropped at once
+    by invalidate() when the tables are edited; the TTL bounds how long other
+    worker processes can serve stale choices.
+    """
+
+    @staticmethod
+    def get(name):
+        now = time.monotonic()
+        entry = _cache.get(name)
+        if entry and entry[0] > now:
+            return entry[1]
+
+        rows = LOADERS[name]()
+        ttl = current_app.config.get('REFERENCE_CACHE_TTL', DEFAULT_TTL)
+        with _lock:
+            _cache[name] = (now + ttl, rows)
+        return rows
+
+    @staticmethod
+    def invalidate(*names):
+        """Drop the named entries, or every entry when no name is given."""
+        with _lock:
+            for name in names or list(_cache):
+                _cache.pop(name, None)
+
+    @staticmethod
+    def departments():
+        return ReferenceData.get('departments')
+
+    @staticmethod
+    def subjects():
+        return ReferenceData.get('subjects')
+
+    @staticmethod
+    def staff():
+        return ReferenceData.get('staff')
+
+    @staticmethod
+    def period_timings():
+        return ReferenceData.get('period_timings')
+
+    @staticmethod
+    def department_choices():
+        return [(d.id, d.name) for d in ReferenceData.departments()]
+
+    @staticmethod
+    def subject_choices():
+        return [(s.id, f'{s.code} - {s.name}') for s in ReferenceData.subjects()]
+
+    @staticmethod
+    def staff_choices():
+        return [(s.id, s.name) for s in ReferenceData.staff()]
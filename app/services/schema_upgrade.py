@@ -0,0 +1,42 @@
+from ..extensions import db
+
+# Columns added to tables after they were first released, oldest first.
+# db.create_all() only creates missing tables, so existing databases get
+# these through `flask upgrade-db`. Each step is
+# (table, column, column DDL, backfill statement or None).
+COLUMN_UPGRADES = (
+    ('attendance_sessions', 'version', 'INTEGER NOT NULL DEFAULT 0', None),
+    ('attendance_sessions_archive', 'original_id', 'INTEGER',
+     'UPDATE attendance_sessions_archive SET original_id = id'),
+    ('attendance_records_archive', 'original_id', 'INTEGER',
+     'UPDATE attendance_records_archive SET original_id = id'),
+)
+
+
+class SchemaUpgrade:
+    @staticmethod
+    def pending():
+        """Column upgrades whose table exists but lacks the column."""
+        inspector = db.inspect(db.engine)
+        steps = []
+        for table, column, ddl, backfill in COLUMN_UPGRADES:
+            if not inspector.has_table(table):
+                continue
+            if column not in {c['name'] for c in inspector.get_columns(table)}:
+                steps.append((table, column, ddl, backfill))
+        return steps
+
+    @staticmethod
+    def upgrade():
+        """
+        Apply the pending column upgrades, each with its backfill in its own
+        transaction. Returns the "table.column" names added.
+        """
+        added = []
+        for table, column, ddl, backfill in SchemaUpgrade.pending():
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}')
+                if backfill:
+                    connection.exec_driver_sql(backfill)
+            added.append(f'{table}.{column}')
+        return added
@@ -5,11 +5,15 @@ from .decorators import (
     management_required,
     hod_required
 )
+from .db import upsert_insert
+from .pagination import keyset_paginate
 
 __all__ = [
     'role_required',
     'student_required',
     'staff_required',
     'management_required',
-    'hod_required'
+    'hod_required',
+    'upsert_insert',
+    'keyset_paginate'
 ]
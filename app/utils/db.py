@@ -0,0 +1,14 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from ..extensions import db
+
+
+def upsert_insert(model):
+    """
+    Return a dialect-specific INSERT for a model's table that supports
+    on_conflict_do_update / on_conflict_do_nothing.
+    Usage: stmt = upsert_insert(Marks).on_conflict_do_nothing()
+    """
+    table = getattr(model, '__table__', model)
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
@@ -0,0 +1,43 @@
+from sqlalchemy import and_, or_
+
+
+PER_PAGE = 50
+
+
+def keyset_filter(columns, values, descending=True):
+    """
+    Build the WHERE clause that selects rows after `values` in the ordering
+    given by `columns`, e.g. (date, id) < (d, i) for a descending listing.
+    """
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        beyond = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal, beyond))
+    return or_(*clauses)
+
+
+def keyset_query(query, columns, after=None, per_page=PER_PAGE, descending=True):
+    """
+    Order `query` by `columns` and limit it to one page after the key
+    `after`, plus one row to detect whether a next page exists.
+    """
+    if after is not None:
+        query = query.filter(keyset_filter(columns, after, descending))
+    order = [column.desc() if descending else column.asc() for column in columns]
+    return query.order_by(*order).limit(per_page + 1)
+
+
+def keyset_paginate(query, columns, key, after=None, per_page=PER_PAGE, descending=True):
+    """
+    Fetch one page of `query` ordered by `columns` using keyset pagination.
+    `key` maps a result row to its values for `columns`; `after` is the key
+    of the last row of the previous page. Returns (items, next_key), where
+    next_key is None on the last page.
+    """
+    rows = keyset_query(query, columns, after, per_page, descending).all()
+
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        return rows, key(rows[-1])
+    return rows, None
@@ -96,6 +96,111 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Incremental attendance saving: send only toggled students as they change
+    const autosaveForm = document.querySelector('form[data-autosave-url]');
+    if (autosaveForm) {
+        const status = autosaveForm.querySelector('.autosave-status');
+        const csrfToken = autosaveForm.querySelector('input[name="csrf_token"]').value;
+        let pending = {};
+        let timer = null;
+        let saving = false;
+        let conflicted = false;
+
+        function setStatus(message) {
+            if (status) {
+                status.textContent = message;
+            }
+        }
+
+        function saveChanges() {
+            if (saving || conflicted || Object.keys(pending).length === 0) {
+                return;
+            }
+            const payload = {
+                version: parseInt(autosaveForm.dataset.version, 10),
+                present: [],
+                absent: []
+            };
+            Object.keys(pending).forEach(function(id) {
+                (pending[id] ? payload.present : payload.absent).push(parseInt(id, 10));
+            });
+            const sent = pending;
+            pending = {};
+            saving = true;
+            setStatus('Saving...');
+
+            fetch(autosaveForm.dataset.autosaveUrl, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': csrfToken
+                },
+                body: JSON.stringify(payload)
+            }).then(function(response) {
+                return response.json().then(function(data) {
+                    return { ok: response.ok, status: response.status, data: data };
+                });
+            }).then(function(result) {
+                saving = false;
+                if (!result.ok) {
+                    // Keep unsent changes; newer toggles of the same students win
+                    pending = Object.assign(sent, pending);
+                    setStatus(result.data.error || 'Could not save changes.');
+                    if (result.status === 409) {
+                        // Changed elsewhere: stop saving rather than overwrite the other edits
+                        conflicted = true;
+                        if (window.confirm('Attendance was changed elsewhere. Reload the page? ' +
+                                           'Your unsaved changes will be lost.')) {
+                            window.location.reload();
+                        }
+                    }
+                    return;
+                }
+                autosaveForm.dataset.version = result.data.version;
+                setStatus('Saved (' + result.data.present + ' present, ' + result.data.absent + ' absent)');
+                saveChanges();
+            }).catch(function() {
+                saving = false;
+                // Keep unsent changes for the next attempt
+                pending = Object.assign(sent, pending);
+                setStatus('Could not save changes.');
+            });
+        }
+
+        autosaveForm.querySelectorAll('.attendance-checkbox').forEach(function(checkbox) {
+            checkbox.addEventListener('change', function() {
+                pending[this.value] = this.checked;
+                clearTimeout(timer);
+                timer = setTimeout(saveChanges, 800);
+            });
+        });
+    }
+
+    // Poll background job progress badges until the job finishes
+    document.querySelectorAll('[data-job-url]').forEach(function(badge) {
+        function poll() {
+            fetch(badge.dataset.jobUrl, {headers: {'Accept': 'application/json'}})
+                .then(function(response) { return response.json(); })
+                .then(function(job) {
+                    if (job.status === 'queued' || job.status === 'running') {
+                        badge.textContent = 'Publishing ' + job.progress + '%';
+                        setTimeout(poll, 2000);
+                    } else if (job.status === 'completed') {
+                        badge.className = 'badge badge-success';
+                        badge.textContent = 'Published (' + job.total + ')';
+                    } else {
+                        badge.className = 'badge badge-danger';
+                        badge.textContent = 'Publishing failed';
+                        badge.title = job.error || '';
+                    }
+                })
+                .catch(function() {
+                    setTimeout(poll, 5000);
+                });
+        }
+        setTimeout(poll, 2000);
+    });
+
     // Modal functionality
     const modalTriggers = document.querySelectorAll('[data-modal]');
     modalTriggers.forEach(function(trigger) {